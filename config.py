@@ -1,4 +1,5 @@
 import os
+import sys
 from dotenv import load_dotenv
 from typing import List, Optional, Dict, Any
 import logging
@@ -74,6 +75,65 @@ INSTA_COOKIES: str = validate_cookies(os.getenv("INSTA_COOKIES", INST_COOKIES))
 FREEMIUM_LIMIT: int = max(0, int(os.getenv("FREEMIUM_LIMIT", "0")))  # minimum 0
 PREMIUM_LIMIT: int = max(10, int(os.getenv("PREMIUM_LIMIT", "500")))  # minimum 10
 
+# Batch concurrency (messages processed in parallel per batch)
+BATCH_WORKERS_FREE: int = max(1, int(os.getenv("BATCH_WORKERS_FREE", "1")))  # minimum 1
+BATCH_WORKERS_PREMIUM: int = max(1, int(os.getenv("BATCH_WORKERS_PREMIUM", "4")))  # minimum 1
+PIPELINE_QUEUE_DEPTH: int = max(1, int(os.getenv("PIPELINE_QUEUE_DEPTH", "2")))  # files buffered between stages
+
+# Telegram rate limiting (per client, adapts to FloodWait)
+RATE_LIMIT_PER_SECOND: float = max(0.1, float(os.getenv("RATE_LIMIT_PER_SECOND", "1")))
+RATE_LIMIT_BURST: int = max(1, int(os.getenv("RATE_LIMIT_BURST", "5")))
+FLOOD_WAIT_RETRIES: int = max(0, int(os.getenv("FLOOD_WAIT_RETRIES", "3")))
+
+# Parallel downloads (concurrent getFile streams per large file)
+DOWNLOAD_WORKERS: int = max(1, int(os.getenv("DOWNLOAD_WORKERS", "4")))  # 1 disables
+PARALLEL_DOWNLOAD_MIN_SIZE: int = max(1, int(os.getenv("PARALLEL_DOWNLOAD_MIN_MB", "20"))) * 1024 * 1024
+
+# Parallel uploads of >2GB files through the userbot (concurrent saveBigFilePart calls)
+UPLOAD_WORKERS: int = max(1, int(os.getenv("UPLOAD_WORKERS", "8")))
+UPLOAD_PART_RETRIES: int = max(0, int(os.getenv("UPLOAD_PART_RETRIES", "5")))
+
+# Pyrogram serializes get_file/save_file per client behind a semaphore of this size
+MAX_CONCURRENT_TRANSMISSIONS: int = max(DOWNLOAD_WORKERS, UPLOAD_WORKERS)
+
+# Temporary storage for downloads (per-job directories under a disk budget)
+STORAGE_DIR: str = os.getenv("STORAGE_DIR", "downloads")
+STORAGE_BUDGET: int = max(1, int(os.getenv("STORAGE_BUDGET_MB", "20480"))) * 1024 * 1024
+TMPFS_DIR: str = os.getenv("TMPFS_DIR", "/dev/shm")  # empty disables tmpfs staging
+TMPFS_BUDGET: int = max(0, int(os.getenv("TMPFS_BUDGET_MB", "512"))) * 1024 * 1024
+TMPFS_MAX_FILE: int = max(0, int(os.getenv("TMPFS_MAX_FILE_MB", "50"))) * 1024 * 1024
+STORAGE_SWEEP_INTERVAL: int = max(60, int(os.getenv("STORAGE_SWEEP_INTERVAL", "600")))  # seconds
+STORAGE_ORPHAN_AGE: int = max(600, int(os.getenv("STORAGE_ORPHAN_AGE", "21600")))  # seconds
+
+# Concurrent ffmpeg probe processes
+PROBE_CONCURRENCY: int = max(1, int(os.getenv("PROBE_CONCURRENCY", "2")))
+
+# Relay documents/audio from source to target without writing them to disk
+STREAM_RELAY: bool = os.getenv("STREAM_RELAY", "true").lower() == "true"
+
+# Reuse LOG_GROUP copies of files other users already extracted
+MEDIA_DEDUPE: bool = os.getenv("MEDIA_DEDUPE", "true").lower() == "true"
+
+# Per-user client pools (started user bots / user clients kept in memory)
+CLIENT_POOL_SIZE: int = max(1, int(os.getenv("CLIENT_POOL_SIZE", "200")))
+CLIENT_IDLE_TIMEOUT: int = max(60, int(os.getenv("CLIENT_IDLE_TIMEOUT", "1800")))  # seconds
+
+# Batch scheduler (fair sharing of batch slots between users)
+MAX_CONCURRENT_BATCHES: int = max(1, int(os.getenv("MAX_CONCURRENT_BATCHES", "5")))  # all users
+MAX_BATCHES_PER_USER: int = max(1, int(os.getenv("MAX_BATCHES_PER_USER", "1")))
+PREMIUM_WEIGHT: float = max(1.0, float(os.getenv("PREMIUM_WEIGHT", "3")))  # share vs. free users
+
+# Distributed job queue (batches handed to `python main.py --worker` processes)
+JOB_QUEUE: bool = os.getenv("JOB_QUEUE", "false").lower() == "true"
+WORKER_MODE: bool = os.getenv("WORKER_MODE", "false").lower() == "true" or "--worker" in sys.argv
+JOB_LEASE_SECONDS: int = max(30, int(os.getenv("JOB_LEASE_SECONDS", "120")))  # reclaimed after this
+JOB_HEARTBEAT_SECONDS: int = max(5, int(os.getenv("JOB_HEARTBEAT_SECONDS", "30")))
+JOB_POLL_SECONDS: int = max(1, int(os.getenv("JOB_POLL_SECONDS", "5")))
+
+# In-process cache of user documents (settings reads skip MongoDB)
+USER_CACHE_SIZE: int = max(1, int(os.getenv("USER_CACHE_SIZE", "10000")))
+USER_CACHE_TTL: int = max(1, int(os.getenv("USER_CACHE_TTL", "300")))  # seconds
+
 # Validate critical configurations
 if not MONGO_DB and DB_NAME == "telegram_downloader":
     logger.warning("Using default database name without MongoDB connection string")
@@ -4,12 +4,16 @@
 
 import asyncio
 from shared_client import start_client
+from config import WORKER_MODE
+from utils.func import ensure_indexes, preload_premium_users
 import importlib
 import os
 import sys
 
 async def load_and_run_plugins():
     await start_client()
+    await ensure_indexes()
+    await preload_premium_users()
     plugin_dir = "plugins"
     plugins = [f[:-3] for f in os.listdir(plugin_dir) if f.endswith(".py") and f != "__init__.py"]
 
@@ -27,7 +31,19 @@ async def load_and_run_plugins():
         except Exception as e:
             print(f"Error loading or running plugin {plugin}: {e}")
 
+async def run_worker_mode():
+    # Workers register no handlers of their own; they only consume batch jobs
+    await start_client()
+    await ensure_indexes()
+    await preload_premium_users()
+    from plugins.batch import run_worker
+    await run_worker()
+
 async def main():
+    if WORKER_MODE:
+        print("Starting in worker mode...")
+        await run_worker_mode()
+        return
     await load_and_run_plugins()
     print("All plugins loaded. Bot is running...")
     # Keep the main task alive, or implement specific logic for the bot to idle or handle tasks.
@@ -1,11 +1,22 @@
 import os
 import re
+import errno
 import time
 import asyncio
 import json
-from typing import Dict, Any, Optional, Tuple
-from pyrogram import Client, filters
-from pyrogram.types import Message
+import socket
+import mimetypes
+import weakref
+from bisect import bisect_right
+from typing import Dict, Any, List, Optional, Tuple, Union
+from pyrogram import Client, filters, raw
+from pyrogram.types import (
+    Message,
+    InputMediaPhoto,
+    InputMediaVideo,
+    InputMediaAudio,
+    InputMediaDocument
+)
 from pyrogram.errors import UserNotParticipant
 from config import (
     API_ID,
@@ -14,79 +25,230 @@ from config import (
     STRING,
     FORCE_SUB,
     FREEMIUM_LIMIT,
-    PREMIUM_LIMIT
+    PREMIUM_LIMIT,
+    BATCH_WORKERS_FREE,
+    BATCH_WORKERS_PREMIUM,
+    PIPELINE_QUEUE_DEPTH,
+    STREAM_RELAY,
+    MEDIA_DEDUPE,
+    MAX_CONCURRENT_BATCHES,
+    JOB_QUEUE,
+    WORKER_MODE,
+    JOB_LEASE_SECONDS,
+    JOB_HEARTBEAT_SECONDS,
+    JOB_POLL_SECONDS,
+    DOWNLOAD_WORKERS,
+    PARALLEL_DOWNLOAD_MIN_SIZE,
+    UPLOAD_WORKERS,
+    MAX_CONCURRENT_TRANSMISSIONS
 )
 from utils.func import (
     get_user_data,
-    screenshot,
-    thumbnail,
-    get_video_metadata,
+    probe_media,
     get_user_data_key,
     process_text_with_rules,
+    load_user_settings,
+    refresh_user_settings,
+    UserSettings,
     is_premium_user,
-    parse_telegram_link
+    parse_telegram_link,
+    parse_batch_links,
+    get_dummy_filename,
+    media_cache_key,
+    get_cached_media,
+    save_cached_media,
+    evict_cached_media,
+    enqueue_job,
+    claim_job,
+    heartbeat_job,
+    complete_job,
+    get_active_job,
+    request_job_cancel
 )
 from shared_client import app as X
-from plugins.settings import rename_file
+from plugins.settings import rename_file, build_renamed_filename
 from plugins.start import subscribe as sub
 from utils.custom_filters import login_in_progress
 from utils.encrypt import dcs
+from utils.ratelimit import call_limited
+from utils.transfer import (
+    relay_media,
+    sent_message_id,
+    parallel_download,
+    record_download,
+    upload_file_parallel,
+    send_uploaded_document
+)
+from utils.clientpool import ClientPool, run_pool_sweeper
+from utils.storage import storage, start_storage_sweeper
+from utils.thumbnails import thumbnails
+from utils.sessions import SESSION_WORKDIR, seed_session_file, drop_session_file
+from utils.scheduler import FairScheduler, ScheduledJob
+
+# Bot API upload limit; larger files go through the userbot
+MAX_BOT_UPLOAD = 2 * 1024 * 1024 * 1024
+
+# Telegram allows at most 10 items per media group
+ALBUM_MAX = 10
 
 # Initialize shared clients and state
 Y = None if not STRING else __import__('shared_client').userbot
-Z, P, UB, UC = {}, {}, {}, {}
+Z, P = {}, {}
+UB = ClientPool("user bot")
+UC = ClientPool("user client", on_evict=lambda user_id: drop_session_file(f'{user_id}_client'))
+POOL_SWEEPER: Optional[asyncio.Task] = None
 
 # Batch processing state management
-ACTIVE_USERS_FILE = "active_users.json"
+BATCH_JOURNAL_FILE = "batch_journal.jsonl"
+LEGACY_ACTIVE_USERS_FILE = "active_users.json"
 ACTIVE_USERS = {}
 
+class BatchJournal:
+    """
+    Append-only JSON-lines journal of batch state.
+    Every change is one small appended record; the file is replayed and
+    compacted at startup, and again every COMPACT_EVERY records, so it
+    stays close to the size of the live batches. A journal without a path (worker mode) keeps nothing; the job
+    document in Mongo is the durable state there.
+    """
+
+    COMPACT_EVERY = 5000  # appended records between compactions
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = None
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._appended = 0
+
+    def replay(self) -> Dict[str, Dict[str, Any]]:
+        """Rebuild the active batches from the journal."""
+        state: Dict[str, Dict[str, Any]] = {}
+        if not self.path or not os.path.exists(self.path):
+            return state
+        with open(self.path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # torn write from a crash
+                user = record.get('user')
+                op = record.get('op')
+                if op == 'start':
+                    state[user] = record['info']
+                elif user not in state:
+                    continue
+                elif op == 'progress':
+                    state[user]['current'] = record['current']
+                    state[user]['success'] = record['success']
+                elif op == 'cancel':
+                    state[user]['cancel_requested'] = True
+                elif op == 'end':
+                    del state[user]
+        return state
+
+    def open(self, state: Dict[str, Dict[str, Any]]) -> None:
+        """
+        Compact the journal down to `state` and open it for appending.
+        `state` is kept (it is the live ACTIVE_USERS dict) for later compactions.
+        """
+        if not self.path:
+            return
+        self._state = state
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for user, info in state.items():
+                f.write(json.dumps({'op': 'start', 'user': user, 'info': info}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'a')
+        self._appended = 0
+
+    def append(self, record: Dict[str, Any], durable: bool = False) -> None:
+        """Append one record; `durable` also fsyncs it."""
+        if not self.path:
+            return
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            if durable:
+                os.fsync(self._file.fileno())
+            self._appended += 1
+            if self._appended >= self.COMPACT_EVERY:
+                # Callers update the live state before appending, so it is current
+                self.open(self._state)
+        except Exception as e:
+            print(f"Error writing batch journal: {e}")
+
+JOURNAL = BatchJournal(None if WORKER_MODE else BATCH_JOURNAL_FILE)
+BATCH_TASKS = set()
+
+# Identifies this process as the lease owner of queued jobs
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Central scheduler that owns every batch job
+SCHEDULER = FairScheduler()
+
 class BatchManager:
     @staticmethod
     def load_active_users() -> Dict:
-        """Load active users from file."""
+        """Load active batches from the journal and compact it."""
         try:
-            if os.path.exists(ACTIVE_USERS_FILE):
-                with open(ACTIVE_USERS_FILE, 'r') as f:
-                    return json.load(f)
-            return {}
+            state = JOURNAL.replay()
+            JOURNAL.open(state)
+            # The old snapshot file had no resume data; drop it
+            if os.path.exists(LEGACY_ACTIVE_USERS_FILE):
+                os.remove(LEGACY_ACTIVE_USERS_FILE)
+            return state
         except Exception as e:
             print(f"Error loading active users: {e}")
             return {}
 
-    @staticmethod
-    async def save_active_users() -> None:
-        """Save active users to file."""
-        try:
-            with open(ACTIVE_USERS_FILE, 'w') as f:
-                json.dump(ACTIVE_USERS, f)
-        except Exception as e:
-            print(f"Error saving active users: {e}")
-
     @staticmethod
     async def add_active_batch(user_id: int, batch_info: Dict[str, Any]) -> None:
         """Add an active batch for a user."""
         ACTIVE_USERS[str(user_id)] = batch_info
-        await BatchManager.save_active_users()
+        JOURNAL.append({'op': 'start', 'user': str(user_id), 'info': batch_info}, durable=True)
 
     @staticmethod
     def is_user_active(user_id: int) -> bool:
         """Check if user has an active batch."""
         return str(user_id) in ACTIVE_USERS
 
+    @staticmethod
+    async def has_active_batch(user_id: int) -> bool:
+        """Check for an active batch here or, with the job queue, on any worker."""
+        if BatchManager.is_user_active(user_id):
+            return True
+        return bool(JOB_QUEUE and await get_active_job(user_id))
+
     @staticmethod
     async def update_batch_progress(user_id: int, current: int, success: int) -> None:
-        """Update batch progress for a user."""
+        """
+        Update batch progress for a user.
+        `current` counts items delivered in order, so it is the resume cursor.
+        """
         if str(user_id) in ACTIVE_USERS:
             ACTIVE_USERS[str(user_id)]["current"] = current
             ACTIVE_USERS[str(user_id)]["success"] = success
-            await BatchManager.save_active_users()
+            JOURNAL.append({
+                'op': 'progress',
+                'user': str(user_id),
+                'current': current,
+                'success': success
+            })
 
     @staticmethod
     async def request_batch_cancel(user_id: int) -> bool:
         """Request cancellation of a batch."""
         if str(user_id) in ACTIVE_USERS:
             ACTIVE_USERS[str(user_id)]["cancel_requested"] = True
-            await BatchManager.save_active_users()
+            JOURNAL.append({'op': 'cancel', 'user': str(user_id)}, durable=True)
             return True
         return False
 
@@ -101,13 +263,60 @@ class BatchManager:
         """Remove an active batch."""
         if str(user_id) in ACTIVE_USERS:
             del ACTIVE_USERS[str(user_id)]
-            await BatchManager.save_active_users()
+            JOURNAL.append({'op': 'end', 'user': str(user_id)}, durable=True)
 
     @staticmethod
     def get_batch_info(user_id: int) -> Optional[Dict[str, Any]]:
         """Get batch info for a user."""
         return ACTIVE_USERS.get(str(user_id))
 
+class PeerCache:
+    """Per-client cache of resolved chat IDs with TTL and negative caching."""
+    TTL = 6 * 60 * 60  # resolved peers rarely change
+    NEGATIVE_TTL = 5 * 60  # retry unresolvable chats after a while
+    
+    _entries: "weakref.WeakKeyDictionary[Client, Dict[str, Tuple[Any, float]]]" = weakref.WeakKeyDictionary()
+    _crawled: "weakref.WeakKeyDictionary[Client, set]" = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def get(client: Client, chat_id: Any) -> Optional[Any]:
+        """Return the cached resolution (or chat_id itself if known-unresolvable)."""
+        entry = PeerCache._entries.get(client, {}).get(str(chat_id))
+        if not entry:
+            return None
+        value, expires = entry
+        if time.monotonic() >= expires:
+            PeerCache._entries[client].pop(str(chat_id), None)
+            return None
+        return value
+
+    @staticmethod
+    def put(client: Client, chat_id: Any, resolved: Any) -> None:
+        PeerCache._entries.setdefault(client, {})[str(chat_id)] = (
+            resolved, time.monotonic() + PeerCache.TTL
+        )
+
+    @staticmethod
+    def put_negative(client: Client, chat_id: Any) -> None:
+        PeerCache._entries.setdefault(client, {})[str(chat_id)] = (
+            chat_id, time.monotonic() + PeerCache.NEGATIVE_TTL
+        )
+
+    @staticmethod
+    def mark_crawled(client: Client, chat_id: Any) -> bool:
+        """Record a dialog crawl for this chat; False if one already ran."""
+        crawled = PeerCache._crawled.setdefault(client, set())
+        if str(chat_id) in crawled:
+            return False
+        crawled.add(str(chat_id))
+        return True
+
+    @staticmethod
+    def forget(client: Client) -> None:
+        """Drop everything cached for a client (e.g. when it is stopped)."""
+        PeerCache._entries.pop(client, None)
+        PeerCache._crawled.pop(client, None)
+
 class ClientManager:
     @staticmethod
     async def update_dialogs(client: Client) -> bool:
@@ -132,14 +341,18 @@ class ClientManager:
         try:
             if link_type == 'public':
                 try:
-                    message = await client.get_messages(chat_id, message_id)
+                    message = await call_limited(
+                        client, client.get_messages, chat_id, message_id
+                    )
                     if getattr(message, "empty", False):
                         try:
                             await user_client.join_chat(chat_id)
                         except:
                             pass
                         chat = await user_client.get_chat(f"@{chat_id}")
-                        message = await user_client.get_messages(chat.id, message_id)
+                        message = await call_limited(
+                            user_client, user_client.get_messages, chat.id, message_id
+                        )
                     return message
                 except Exception as e:
                     print(f'Error fetching public message: {e}')
@@ -149,9 +362,10 @@ class ClientManager:
                     return None
                     
                 try:
-                    await ClientManager.update_dialogs(user_client)
                     resolved_id = await ClientManager.resolve_chat_id(user_client, chat_id)
-                    return await user_client.get_messages(resolved_id, message_id)
+                    return await call_limited(
+                        user_client, user_client.get_messages, resolved_id, message_id
+                    )
                 except Exception as e:
                     print(f'Private channel error: {e}')
                     return None
@@ -160,8 +374,8 @@ class ClientManager:
             return None
 
     @staticmethod
-    async def resolve_chat_id(client: Client, chat_id: str) -> str:
-        """Resolve a chat ID to its proper format."""
+    async def _resolve_once(client: Client, chat_id: str) -> Union[str, int]:
+        """Resolve a chat ID without touching dialogs; raises if unknown."""
         try:
             peer = await client.resolve_peer(chat_id)
             if hasattr(peer, 'channel_id'):
@@ -172,12 +386,36 @@ class ClientManager:
                 return peer.user_id
             return chat_id
         except Exception:
-            try:
-                chat = await client.get_chat(chat_id)
-                return chat.id
-            except Exception:
+            chat = await client.get_chat(chat_id)
+            return chat.id
+
+    @staticmethod
+    async def resolve_chat_id(client: Client, chat_id: str) -> str:
+        """
+        Resolve a chat ID to its proper format.
+        Results are cached per client; the dialog crawl only runs when a
+        chat cannot be resolved, and at most once per chat per session.
+        """
+        cached = PeerCache.get(client, chat_id)
+        if cached is not None:
+            return cached
+        
+        try:
+            resolved = await ClientManager._resolve_once(client, chat_id)
+        except Exception:
+            resolved = None
+            if PeerCache.mark_crawled(client, chat_id):
                 await ClientManager.update_dialogs(client)
-                return chat_id
+                try:
+                    resolved = await ClientManager._resolve_once(client, chat_id)
+                except Exception:
+                    pass
+        
+        if resolved is None:
+            PeerCache.put_negative(client, chat_id)
+            return chat_id
+        PeerCache.put(client, chat_id, resolved)
+        return resolved
 
     @staticmethod
     async def get_user_bot(user_id: int) -> Optional[Client]:
@@ -186,15 +424,17 @@ class ClientManager:
         if not bot_token:
             return None
             
-        if user_id in UB:
-            return UB[user_id]
+        bot = UB.lookup(user_id)
+        if bot:
+            return bot
             
         try:
             bot = Client(
                 f"user_{user_id}",
                 bot_token=bot_token,
                 api_id=API_ID,
-                api_hash=API_HASH
+                api_hash=API_HASH,
+                max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS
             )
             await bot.start()
             UB[user_id] = bot
@@ -206,9 +446,10 @@ class ClientManager:
     @staticmethod
     async def get_user_client(user_id: int) -> Optional[Client]:
         """Get or create a user client."""
-        # Check cached client
-        if user_id in UC:
-            return UC[user_id]
+        # Check pooled client
+        client = UC.lookup(user_id)
+        if client:
+            return client
             
         # Get user data
         user_data = await get_user_data(user_id)
@@ -220,15 +461,7 @@ class ClientManager:
         if session_string:
             try:
                 decrypted_session = dcs(session_string)
-                client = Client(
-                    f'{user_id}_client',
-                    api_id=API_ID,
-                    api_hash=API_HASH,
-                    device_model="v3saver",
-                    session_string=decrypted_session
-                )
-                await client.start()
-                await ClientManager.update_dialogs(client)
+                client = await ClientManager._start_user_client(user_id, decrypted_session)
                 UC[user_id] = client
                 return client
             except Exception as e:
@@ -237,55 +470,305 @@ class ClientManager:
                 
         return await ClientManager.get_user_bot(user_id) or Y
 
+    @staticmethod
+    async def _start_user_client(user_id: int, session_string: str) -> Client:
+        """
+        Start a user client from its persisted session file, seeding the
+        file from the session string on first use. Dialogs are not crawled
+        here; resolve_chat_id loads them only for unresolvable chats.
+        """
+        name = f'{user_id}_client'
+        started = time.monotonic()
+        try:
+            warm = await seed_session_file(name, session_string)
+            client = Client(
+                name,
+                api_id=API_ID,
+                api_hash=API_HASH,
+                device_model="v3saver",
+                workdir=SESSION_WORKDIR,
+                max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS
+            )
+            await client.start()
+        except Exception as e:
+            # Stale or unreadable session file: start from the string as before
+            print(f'Warm start failed for user {user_id}, using session string: {e}')
+            drop_session_file(name)
+            warm = False
+            client = Client(
+                name,
+                api_id=API_ID,
+                api_hash=API_HASH,
+                device_model="v3saver",
+                session_string=session_string,
+                max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS
+            )
+            await client.start()
+        
+        StartupMetrics.record_start(user_id, warm, time.monotonic() - started)
+        return client
+
+class StartupMetrics:
+    """Client start and time-to-first-message timings, split by warm/cold start."""
+    stats: Dict[str, Dict[str, float]] = {
+        kind: {'starts': 0, 'start_seconds': 0.0, 'first_messages': 0, 'first_message_seconds': 0.0}
+        for kind in ('warm', 'cold')
+    }
+    warm_users: Dict[int, bool] = {}
+
+    @staticmethod
+    def record_start(user_id: int, warm: bool, seconds: float) -> None:
+        kind = 'warm' if warm else 'cold'
+        StartupMetrics.warm_users[user_id] = warm
+        StartupMetrics.stats[kind]['starts'] += 1
+        StartupMetrics.stats[kind]['start_seconds'] += seconds
+        print(f'Started {kind} client for user {user_id} in {seconds:.2f}s')
+
+    @staticmethod
+    def record_first_message(user_id: int, seconds: float) -> None:
+        """Record the time from a request until its first message was delivered."""
+        warm = StartupMetrics.warm_users.pop(user_id, None)
+        if warm is None:
+            return  # client was already running, nothing to measure
+        kind = 'warm' if warm else 'cold'
+        StartupMetrics.stats[kind]['first_messages'] += 1
+        StartupMetrics.stats[kind]['first_message_seconds'] += seconds
+        print(f'Time to first message for user {user_id}: {seconds:.2f}s ({kind} client)')
+
+    @staticmethod
+    def summary() -> Dict[str, Dict[str, float]]:
+        """Average start and time-to-first-message seconds per start kind."""
+        return {
+            kind: {
+                'starts': data['starts'],
+                'avg_start_seconds': data['start_seconds'] / data['starts'] if data['starts'] else 0.0,
+                'avg_first_message_seconds': (
+                    data['first_message_seconds'] / data['first_messages']
+                    if data['first_messages'] else 0.0
+                )
+            }
+            for kind, data in StartupMetrics.stats.items()
+        }
+
+class MessagePrefetcher:
+    """Fetch a batch range in windows of up to 200 IDs ahead of the workers."""
+    WINDOW_SIZE = 200  # maximum IDs per get_messages call
+
+    def __init__(
+        self,
+        client: Client,
+        user_client: Optional[Client],
+        chat_id: str,
+        link_type: str,
+        first_id: int,
+        count: int
+    ) -> None:
+        self.client = client
+        self.user_client = user_client
+        self.chat_id = chat_id
+        self.link_type = link_type
+        self.first_id = first_id
+        self.last_id = first_id + count - 1
+        self._windows: Dict[int, asyncio.Task] = {}
+        self._fallback_chat_id = None
+
+    def _window_start(self, message_id: int) -> int:
+        offset = message_id - self.first_id
+        return self.first_id + (offset // self.WINDOW_SIZE) * self.WINDOW_SIZE
+
+    def _schedule(self, start: int) -> None:
+        if start <= self.last_id and start not in self._windows:
+            self._windows[start] = asyncio.create_task(self._fetch_window(start))
+
+    async def _fetch_ids(self, client: Client, chat_id: Any, ids: list) -> Dict[int, Message]:
+        messages = await call_limited(client, client.get_messages, chat_id, ids)
+        return {
+            m.id: m for m in messages
+            if m and not getattr(m, "empty", False)
+        }
+
+    async def _fetch_window(self, start: int) -> Optional[Dict[int, Message]]:
+        """Fetch one window; returns None if the bulk request failed."""
+        ids = list(range(start, min(start + self.WINDOW_SIZE, self.last_id + 1)))
+        try:
+            if self.link_type == 'public':
+                found = await self._fetch_ids(self.client, self.chat_id, ids)
+                missing = [i for i in ids if i not in found]
+                if missing and self.user_client:
+                    # Bot cannot see these: retry through the user client
+                    if self._fallback_chat_id is None:
+                        try:
+                            await self.user_client.join_chat(self.chat_id)
+                        except Exception:
+                            pass
+                        chat = await self.user_client.get_chat(f"@{self.chat_id}")
+                        self._fallback_chat_id = chat.id
+                    found.update(await self._fetch_ids(
+                        self.user_client, self._fallback_chat_id, missing
+                    ))
+                return found
+            
+            if not self.user_client:
+                return {}
+            resolved_id = await ClientManager.resolve_chat_id(self.user_client, self.chat_id)
+            return await self._fetch_ids(self.user_client, resolved_id, ids)
+        except Exception as e:
+            print(f'Prefetch error for {self.chat_id} [{ids[0]}-{ids[-1]}]: {e}')
+            return None
+
+    async def get(self, message_id: int) -> Optional[Message]:
+        """Get a message, fetching its window and the next one if needed."""
+        start = self._window_start(message_id)
+        self._schedule(start)
+        self._schedule(start + self.WINDOW_SIZE)
+        
+        # Drop finished windows the workers have moved past
+        for old in [w for w in self._windows if w < start - self.WINDOW_SIZE]:
+            if self._windows[old].done():
+                del self._windows[old]
+        
+        window = await self._windows[start]
+        if window is None:
+            return await ClientManager.get_message(
+                self.client,
+                self.user_client,
+                self.chat_id,
+                message_id,
+                self.link_type
+            )
+        return window.get(message_id)
+
+    def close(self) -> None:
+        """Cancel any window fetches still in flight."""
+        for task in self._windows.values():
+            if not task.done():
+                task.cancel()
+        self._windows.clear()
+
 class ProgressManager:
+    """
+    Coalescing progress scheduler.
+    Transfer callbacks only record the latest state in P; a single
+    background task turns that state into at most one edit per message
+    every MESSAGE_INTERVAL seconds, spaced CHAT_INTERVAL apart per chat.
+    """
+
+    FLUSH_INTERVAL = 1.0  # scheduler tick
+    MESSAGE_INTERVAL = 5.0  # minimum gap between edits of one message
+    CHAT_INTERVAL = 1.5  # minimum gap between edits in one chat
+    STALE_AFTER = 120.0  # drop entries whose transfer stopped reporting
+
+    _last_chat_edit: Dict[int, float] = {}
+    _flusher: Optional[asyncio.Task] = None
+
     @staticmethod
     async def update_progress(
-        client: Client,
-        total: int,
         current: int,
+        total: int,
+        client: Client,
         chat_id: int,
         message_id: int,
         start_time: float
     ) -> None:
-        """Update progress message."""
-        progress = current / total * 100
-        interval = (
-            10 if total >= 100 * 1024 * 1024 else
-            20 if total >= 50 * 1024 * 1024 else
-            30 if total >= 10 * 1024 * 1024 else
-            50
-        )
-        step = int(progress // interval) * interval
-        
-        if message_id not in P or P[message_id] != step or progress >= 100:
-            P[message_id] = step
-            
-            current_mb = current / (1024 * 1024)
-            total_mb = total / (1024 * 1024)
-            bar = '🟢' * int(progress / 10) + '🔴' * (10 - int(progress / 10))
-            
-            elapsed = time.time() - start_time
-            speed = current / elapsed / (1024 * 1024) if elapsed > 0 else 0
-            eta = time.strftime(
-                '%M:%S',
-                time.gmtime((total - current) / (speed * 1024 * 1024))
-            ) if speed > 0 else '00:00'
-            
-            text = (
-                f"__**Pyro Handler...**__\n\n{bar}\n\n"
-                f"⚡**__Completed__**: {current_mb:.2f} MB / {total_mb:.2f} MB\n"
-                f"📊 **__Done__**: {progress:.2f}%\n"
-                f"🚀 **__Speed__**: {speed:.2f} MB/s\n"
-                f"⏳ **__ETA__**: {eta}\n\n"
-                f"**__Powered by Team SPY__**"
-            )
-            
+        """Record transfer progress; the message is edited by the flusher."""
+        entry = P.get((chat_id, message_id))
+        P[(chat_id, message_id)] = {
+            'client': client,
+            'current': current,
+            'total': total,
+            'start_time': start_time,
+            'updated': time.monotonic(),
+            'edited': entry['edited'] if entry else 0.0
+        }
+        ProgressManager._ensure_flusher()
+
+    @staticmethod
+    def finish(chat_id: int, message_id: int) -> None:
+        """Forget a progress message once its transfer completed or failed."""
+        P.pop((chat_id, message_id), None)
+
+    @staticmethod
+    def _ensure_flusher() -> None:
+        task = ProgressManager._flusher
+        if task is None or task.done():
+            ProgressManager._flusher = asyncio.create_task(ProgressManager._run())
+
+    @staticmethod
+    async def _run() -> None:
+        """Flush pending progress until nothing is left to report."""
+        while P:
+            await asyncio.sleep(ProgressManager.FLUSH_INTERVAL)
             try:
-                await client.edit_message_text(chat_id, message_id, text)
-                if progress >= 100:
-                    P.pop(message_id, None)
+                await ProgressManager._flush()
             except Exception as e:
-                print(f"Error updating progress: {e}")
+                print(f"Error flushing progress: {e}")
+
+    @staticmethod
+    async def _flush() -> None:
+        """Edit every progress message that is due, oldest edit first."""
+        now = time.monotonic()
+        # Chats edited longer than CHAT_INTERVAL ago no longer hold anything back
+        last_edits = ProgressManager._last_chat_edit
+        for chat_id in [c for c, t in last_edits.items() if now - t >= ProgressManager.CHAT_INTERVAL]:
+            del last_edits[chat_id]
+        due = []
+        for key, entry in list(P.items()):
+            if now - entry['updated'] > ProgressManager.STALE_AFTER:
+                P.pop(key, None)
+                continue
+            done = entry['current'] >= entry['total']
+            if entry['edited'] and not done and now - entry['edited'] < ProgressManager.MESSAGE_INTERVAL:
+                continue
+            if entry['edited'] >= entry['updated']:
+                continue
+            due.append((entry['edited'], key))
+
+        for _, key in sorted(due):
+            chat_id, message_id = key
+            entry = P.get(key)
+            if entry is None:
+                continue
+            now = time.monotonic()
+            if now - ProgressManager._last_chat_edit.get(chat_id, 0.0) < ProgressManager.CHAT_INTERVAL:
+                continue
+            ProgressManager._last_chat_edit[chat_id] = now
+            entry['edited'] = now
+            try:
+                await entry['client'].edit_message_text(
+                    chat_id, message_id, ProgressManager.render(entry)
+                )
+            except Exception as e:
+                if 'MESSAGE_NOT_MODIFIED' not in str(e):
+                    print(f"Error updating progress: {e}")
+                    P.pop(key, None)
+                    continue
+            if entry['current'] >= entry['total']:
+                P.pop(key, None)
+
+    @staticmethod
+    def render(entry: Dict[str, Any]) -> str:
+        """Render a progress entry as message text."""
+        current, total = entry['current'], entry['total']
+        progress = current / total * 100 if total else 100.0
+        current_mb = current / (1024 * 1024)
+        total_mb = total / (1024 * 1024)
+        bar = '🟢' * int(progress / 10) + '🔴' * (10 - int(progress / 10))
+        
+        elapsed = time.time() - entry['start_time']
+        speed = current / elapsed / (1024 * 1024) if elapsed > 0 else 0
+        eta = time.strftime(
+            '%M:%S',
+            time.gmtime((total - current) / (speed * 1024 * 1024))
+        ) if speed > 0 else '00:00'
+        
+        return (
+            f"__**Pyro Handler...**__\n\n{bar}\n\n"
+            f"⚡**__Completed__**: {current_mb:.2f} MB / {total_mb:.2f} MB\n"
+            f"📊 **__Done__**: {progress:.2f}%\n"
+            f"🚀 **__Speed__**: {speed:.2f} MB/s\n"
+            f"⏳ **__ETA__**: {eta}\n\n"
+            f"**__Powered by Team SPY__**"
+        )
 
 class MessageProcessor:
     @staticmethod
@@ -299,7 +782,8 @@ class MessageProcessor:
         """Send a message directly to target chat."""
         try:
             if message.video:
-                await client.send_video(
+                await call_limited(
+                    client, client.send_video,
                     target_chat_id,
                     message.video.file_id,
                     caption=formatted_text,
@@ -309,25 +793,29 @@ class MessageProcessor:
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.video_note:
-                await client.send_video_note(
+                await call_limited(
+                    client, client.send_video_note,
                     target_chat_id,
                     message.video_note.file_id,
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.voice:
-                await client.send_voice(
+                await call_limited(
+                    client, client.send_voice,
                     target_chat_id,
                     message.voice.file_id,
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.sticker:
-                await client.send_sticker(
+                await call_limited(
+                    client, client.send_sticker,
                     target_chat_id,
                     message.sticker.file_id,
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.audio:
-                await client.send_audio(
+                await call_limited(
+                    client, client.send_audio,
                     target_chat_id,
                     message.audio.file_id,
                     caption=formatted_text,
@@ -341,14 +829,16 @@ class MessageProcessor:
                     message.photo.file_id if hasattr(message.photo, 'file_id')
                     else message.photo[-1].file_id
                 )
-                await client.send_photo(
+                await call_limited(
+                    client, client.send_photo,
                     target_chat_id,
                     photo_id,
                     caption=formatted_text,
                     reply_to_message_id=reply_to_message_id
                 )
             elif message.document:
-                await client.send_document(
+                await call_limited(
+                    client, client.send_document,
                     target_chat_id,
                     message.document.file_id,
                     caption=formatted_text,
@@ -363,280 +853,1016 @@ class MessageProcessor:
             return False
 
     @staticmethod
-    async def process_message(
+    async def prepare(
+        user_id: int,
+        message: Message,
+        link_type: str,
+        target_chat_id: int,
+        settings: Optional[UserSettings] = None
+    ) -> Dict[str, Any]:
+        """Resolve destination and caption for a message (fetch stage)."""
+        if settings is None:
+            settings = await load_user_settings(user_id)
+        
+        # Get target chat configuration
+        cfg_chat = settings.chat_id
+        reply_to_id = None
+        
+        if cfg_chat and '/' in cfg_chat:
+            parts = cfg_chat.split('/', 1)
+            target_chat_id = int(parts[0])
+            reply_to_id = int(parts[1]) if len(parts) > 1 else None
+        
+        item = {
+            'settings': settings,
+            'message': message,
+            'link_type': link_type,
+            'target_chat_id': target_chat_id,
+            'reply_to_id': reply_to_id,
+            'final_text': None,
+            'file_path': None,
+            'progress_msg': None,
+            'status': 'text' if not message.media else 'pending'
+        }
+        if not message.media:
+            return item
+        
+        # Process media captions
+        original_text = message.caption.markdown if message.caption else ''
+        processed_text = await process_text_with_rules(user_id, original_text, settings)
+        user_caption = settings.caption
+        
+        item['final_text'] = (
+            f'{processed_text}\n\n{user_caption}' if processed_text and user_caption
+            else user_caption if user_caption
+            else processed_text
+        )
+        if message.media_group_id:
+            item['media_group_id'] = message.media_group_id
+        
+        # Public media can usually be sent directly by file_id
+        if link_type == 'public' and not getattr(message, "empty", False):
+            item['status'] = 'direct'
+        return item
+
+    @staticmethod
+    async def download(
         client: Client,
         user_client: Client,
-        message: Message,
         user_id: int,
-        chat_id: str,
-        message_id: int,
-        link_type: str,
-        target_chat_id: int
-    ) -> str:
-        """Process a single message."""
+        item: Dict[str, Any]
+    ) -> None:
+        """Download the media of a prepared item (download stage)."""
+        if item['status'] != 'pending':
+            return
+        if await MessageProcessor.lookup_cache(user_id, item):
+            return
+        if await MessageProcessor.plan_stream(user_id, item):
+            return
+        
+        message = item['message']
+        media = MessageProcessor.media_of(message)
+        item['storage'] = await storage.acquire(getattr(media, 'file_size', 0))
+        item['progress_msg'] = progress_msg = await call_limited(
+            client, client.send_message, user_id, 'Downloading...'
+        )
+        item['start_time'] = time.time()
+        progress_args = (
+            client,
+            user_id,
+            progress_msg.id,
+            item['start_time']
+        )
+        
         try:
-            # Get target chat configuration
-            cfg_chat = await get_user_data_key(user_id, 'chat_id', None)
-            reply_to_id = None
-            
-            if cfg_chat and '/' in cfg_chat:
-                parts = cfg_chat.split('/', 1)
-                target_chat_id = int(parts[0])
-                reply_to_id = int(parts[1]) if len(parts) > 1 else None
-            
-            # Handle text messages
-            if not message.media:
-                await client.send_message(
-                    target_chat_id,
-                    text=message.text.markdown,
-                    reply_to_message_id=reply_to_id
+            file_path = await MessageProcessor.fetch_media(user_client, item, progress_args)
+            if not file_path and item['storage'].tmpfs:
+                # Most likely tmpfs filled up (ENOSPC): retry once on disk
+                print(f'Download to tmpfs failed for user {user_id}, retrying on disk')
+                item['storage'] = await storage.move_to_disk(item['storage'])
+                file_path = await MessageProcessor.fetch_media(user_client, item, progress_args)
+        except Exception as e:
+            await MessageProcessor.fail(client, user_id, item, f'Download failed: {str(e)[:30]}')
+            return
+        ProgressManager.finish(user_id, progress_msg.id)
+        
+        if not file_path:
+            await MessageProcessor.fail(client, user_id, item, 'Failed to download.')
+            item['result'] = 'Download failed.'
+            return
+        
+        item['file_path'] = file_path
+        item['status'] = 'downloaded'
+
+    @staticmethod
+    async def fetch_media(
+        user_client: Client,
+        item: Dict[str, Any],
+        progress_args: tuple
+    ) -> Optional[str]:
+        """
+        Download an item's media into its job directory: in parallel if it
+        is large enough, otherwise (or if that failed) with download_media.
+        Returns None if a tmpfs job directory ran out of space.
+        """
+        message = item['message']
+        media = MessageProcessor.media_of(message)
+        try:
+            file_path = await MessageProcessor.download_parallel(user_client, item, progress_args)
+            if not file_path:
+                started = time.monotonic()
+                file_path = await call_limited(
+                    user_client, user_client.download_media,
+                    message,
+                    file_name=item['storage'].path + os.sep,
+                    progress=ProgressManager.update_progress,
+                    progress_args=progress_args
                 )
-                return 'Sent.'
-            
-            # Process media messages
-            original_text = message.caption.markdown if message.caption else ''
-            processed_text = await process_text_with_rules(user_id, original_text)
-            user_caption = await get_user_data_key(user_id, 'caption', '')
-            
-            final_text = (
-                f'{processed_text}\n\n{user_caption}' if processed_text and user_caption
-                else user_caption if user_caption
-                else processed_text
+                if file_path and getattr(media, 'file_size', None):
+                    record_download('sequential', media.file_size, time.monotonic() - started)
+            return file_path
+        except OSError as e:
+            if e.errno == errno.ENOSPC and item['storage'].tmpfs:
+                return None
+            raise
+
+    @staticmethod
+    async def download_parallel(
+        user_client: Client,
+        item: Dict[str, Any],
+        progress_args: tuple
+    ) -> Optional[str]:
+        """
+        Download a large video/document/audio over several concurrent
+        streams. Returns None when the file is too small or the parallel
+        download failed, so the caller uses download_media instead.
+        """
+        message = item['message']
+        media = message.video or message.document or message.audio or message.animation
+        if DOWNLOAD_WORKERS < 2 or not media or (media.file_size or 0) < PARALLEL_DOWNLOAD_MIN_SIZE:
+            return None
+        
+        kind = 'video' if message.video else 'audio' if message.audio else 'document'
+        file_name = getattr(media, 'file_name', None) or get_dummy_filename({'type': kind})
+        try:
+            return await parallel_download(
+                user_client,
+                message,
+                item['storage'].file(file_name),
+                media.file_size,
+                DOWNLOAD_WORKERS,
+                ProgressManager.update_progress,
+                progress_args
             )
-            
-            # Try direct send for public channels
-            if link_type == 'public' and not getattr(message, "empty", False):
-                if await MessageProcessor.send_direct(
+        except Exception as e:
+            print(f'Parallel download failed, retrying sequentially: {e}')
+            return None
+
+    @staticmethod
+    def media_of(message: Message) -> Optional[Any]:
+        """Get the media object (video, document, ...) of a message."""
+        for kind in ('video', 'audio', 'document', 'photo', 'voice', 'video_note', 'animation'):
+            media = getattr(message, kind, None)
+            if media:
+                return media
+        return None
+
+    @staticmethod
+    async def lookup_cache(user_id: int, item: Dict[str, Any]) -> bool:
+        """
+        Look the item up in the cross-user dedupe cache. The key covers the
+        file identity and everything that changes the uploaded result:
+        final file name (rename rules), caption and custom thumbnail.
+        """
+        message = item['message']
+        media = MessageProcessor.media_of(message)
+        if not MEDIA_DEDUPE or item.get('no_cache') or not getattr(media, 'file_unique_id', None):
+            return False
+        if 'cache_key' in item:
+            return False  # already looked up (and missed) for this message
+        
+        file_name = getattr(media, 'file_name', None)
+        if file_name:
+            file_name = await build_renamed_filename(file_name, user_id, item['settings'])
+        item['cache_key'] = media_cache_key(
+            media.file_unique_id,
+            file_name=file_name,
+            caption=item['final_text'] if message.caption else None,
+            thumb=await thumbnails.stamp(user_id)
+        )
+        
+        cached = await get_cached_media(item['cache_key'])
+        if not cached:
+            return False
+        item['cached'] = cached
+        item['status'] = 'cached'
+        return True
+
+    @staticmethod
+    async def remember(
+        item: Dict[str, Any],
+        chat_id: Any,
+        message_id: Optional[int],
+        sent: Optional[Message] = None
+    ) -> None:
+        """
+        Record the message a fresh upload was sent as, so other users get it
+        without another upload. No extra copy is sent: a bot-sent message
+        gives a reusable file_id, others are copied from where they are.
+        """
+        if not item.get('cache_key') or not message_id:
+            return
+        media = MessageProcessor.media_of(sent) if sent else None
+        await save_cached_media(
+            item['cache_key'],
+            chat_id,
+            message_id,
+            getattr(media, 'file_id', None)
+        )
+
+    @staticmethod
+    async def plan_stream(user_id: int, item: Dict[str, Any]) -> bool:
+        """
+        Mark an item for the disk-free relay when no post-processing needs
+        the whole file: documents and audio that will not be sent as video.
+        """
+        message = item['message']
+        media = message.audio or message.document
+        if not STREAM_RELAY or item.get('no_stream') or not media or message.video:
+            return False
+        if not media.file_size or media.file_size > MAX_BOT_UPLOAD:
+            return False
+        if (media.mime_type or '').startswith('video/'):
+            return False
+        
+        if media.file_name:
+            file_name = await build_renamed_filename(
+                media.file_name, user_id, item['settings']
+            )
+        else:
+            file_name = get_dummy_filename({'type': 'audio' if message.audio else 'document'})
+        if file_name.lower().endswith('.mp4'):
+            return False  # will be sent as video: needs probe and screenshot
+        
+        item['stream_name'] = file_name
+        item['status'] = 'stream'
+        return True
+
+    @staticmethod
+    async def relay(
+        client: Client,
+        user_client: Client,
+        user_id: int,
+        item: Dict[str, Any]
+    ) -> bool:
+        """Stream an item straight from the source chat to the target chat."""
+        message = item['message']
+        progress_msg = await call_limited(
+            client, client.send_message, user_id, 'Streaming...'
+        )
+        try:
+            updates = await relay_media(
+                user_client,
+                client,
+                message,
+                item['target_chat_id'],
+                item['stream_name'],
+                caption=item['final_text'] if message.caption else None,
+                reply_to_message_id=item['reply_to_id'],
+                thumb=await thumbnails.get(user_id),
+                progress=ProgressManager.update_progress,
+                progress_args=(
                     client,
-                    message,
-                    target_chat_id,
-                    final_text,
-                    reply_to_id
-                ):
-                    return 'Sent directly.'
+                    user_id,
+                    progress_msg.id,
+                    time.time()
+                )
+            )
+            await MessageProcessor.remember(
+                item, item['target_chat_id'], sent_message_id(updates)
+            )
+            return True
+        except Exception as e:
+            print(f'Stream relay failed, falling back to disk: {e}')
+            return False
+        finally:
+            ProgressManager.finish(user_id, progress_msg.id)
+            await client.delete_messages(user_id, progress_msg.id)
+
+    @staticmethod
+    async def post_process(
+        client: Client,
+        user_id: int,
+        item: Dict[str, Any]
+    ) -> None:
+        """Rename and probe a downloaded file (post-process stage)."""
+        if item['status'] != 'downloaded':
+            return
+        
+        message = item['message']
+        progress_msg = item['progress_msg']
+        
+        try:
+            # Rename file if needed
+            await client.edit_message_text(user_id, progress_msg.id, 'Renaming...')
+            if any([
+                (message.video and message.video.file_name),
+                (message.audio and message.audio.file_name),
+                (message.document and message.document.file_name)
+            ]):
+                item['file_path'] = await rename_file(
+                    item['file_path'], user_id, item['settings']
+                )
             
-            # Download and process media
-            progress_msg = await client.send_message(user_id, 'Downloading...')
-            start_time = time.time()
+            file_path = item['file_path']
+            item['large'] = bool(os.path.getsize(file_path) > MAX_BOT_UPLOAD and Y)
+            item['thumb'] = await thumbnails.get(user_id)
+            item['metadata'] = None
             
-            try:
-                file_path = await user_client.download_media(
-                    message,
-                    progress=ProgressManager.update_progress,
-                    progress_args=(
-                        client,
-                        user_id,
-                        progress_msg.id,
-                        start_time
-                    )
-                )
-                
-                if not file_path:
-                    await client.edit_message_text(
-                        user_id,
-                        progress_msg.id,
-                        'Failed to download.'
-                    )
-                    return 'Download failed.'
-                
-                # Rename file if needed
-                await client.edit_message_text(user_id, progress_msg.id, 'Renaming...')
-                if any([
-                    (message.video and message.video.file_name),
-                    (message.audio and message.audio.file_name),
-                    (message.document and message.document.file_name)
-                ]):
-                    file_path = await rename_file(file_path, user_id, progress_msg)
-                
-                file_size = os.path.getsize(file_path)
-                thumb = thumbnail(user_id)
-                
-                # Handle large files (>2GB)
-                if file_size > 2 * 1024 * 1024 * 1024 and Y:
-                    await client.edit_message_text(
-                        user_id,
-                        progress_msg.id,
-                        'File is larger than 2GB. Using alternative method...'
-                    )
-                    
-                    await ClientManager.update_dialogs(Y)
-                    metadata = await get_video_metadata(file_path)
-                    thumb = await screenshot(
-                        file_path,
-                        metadata['duration'],
-                        user_id
-                    )
-                    
-                    # Determine media type and send accordingly
-                    media_type = None
-                    if file_path.endswith('.mp4'):
-                        media_type = 'video'
-                    elif message.video_note:
-                        media_type = 'video_note'
-                    elif message.voice:
-                        media_type = 'voice'
-                    elif message.audio:
-                        media_type = 'audio'
-                    elif message.photo:
-                        media_type = 'photo'
-                    else:
-                        media_type = 'document'
-                    
-                    # Send to log group first
-                    send_method = getattr(Y, f'send_{media_type}', Y.send_document)
-                    sent_message = await send_method(
-                        LOG_GROUP,
-                        file_path,
-                        thumb=thumb if media_type == 'video' else None,
-                        duration=metadata['duration'] if media_type == 'video' else None,
-                        height=metadata['height'] if media_type == 'video' else None,
-                        width=metadata['width'] if media_type == 'video' else None,
-                        caption=final_text if message.caption and media_type not in ['video_note', 'voice'] else None,
-                        reply_to_message_id=reply_to_id,
-                        progress=ProgressManager.update_progress,
-                        progress_args=(
-                            client,
-                            user_id,
-                            progress_msg.id,
-                            start_time
-                        )
-                    )
-                    
-                    # Copy to target chat
-                    await client.copy_message(
-                        target_chat_id,
-                        LOG_GROUP,
-                        sent_message.id
-                    )
-                    
-                    # Cleanup
-                    os.remove(file_path)
-                    await client.delete_messages(user_id, progress_msg.id)
-                    
-                    return 'Done (Large file).'
-                
-                # Upload normally for smaller files
-                await client.edit_message_text(user_id, progress_msg.id, 'Uploading...')
-                
-                if message.video or os.path.splitext(file_path)[1].lower() == '.mp4':
-                    metadata = await get_video_metadata(file_path)
-                    thumb = await screenshot(
-                        file_path,
-                        metadata['duration'],
-                        user_id
-                    )
-                    
-                    await client.send_video(
-                        target_chat_id,
-                        video=file_path,
-                        caption=final_text if message.caption else None,
-                        thumb=thumb,
-                        width=metadata['width'],
-                        height=metadata['height'],
-                        duration=metadata['duration'],
-                        progress=ProgressManager.update_progress,
-                        progress_args=(
-                            client,
-                            user_id,
-                            progress_msg.id,
-                            start_time
-                        ),
-                        reply_to_message_id=reply_to_id
-                    )
+            # Determine media type
+            if item['large']:
+                if file_path.endswith('.mp4'):
+                    media_type = 'video'
                 elif message.video_note:
-                    await client.send_video_note(
-                        target_chat_id,
-                        video_note=file_path,
-                        progress=ProgressManager.update_progress,
-                        progress_args=(
-                            client,
-                            user_id,
-                            progress_msg.id,
-                            start_time
-                        ),
-                        reply_to_message_id=reply_to_id
-                    )
+                    media_type = 'video_note'
                 elif message.voice:
-                    await client.send_voice(
-                        target_chat_id,
-                        voice=file_path,
-                        progress=ProgressManager.update_progress,
-                        progress_args=(
-                            client,
-                            user_id,
-                            progress_msg.id,
-                            start_time
-                        ),
-                        reply_to_message_id=reply_to_id
-                    )
-                elif message.sticker:
-                    await client.send_sticker(
-                        target_chat_id,
-                        message.sticker.file_id
-                    )
+                    media_type = 'voice'
                 elif message.audio:
-                    await client.send_audio(
-                        target_chat_id,
-                        audio=file_path,
-                        caption=final_text if message.caption else None,
-                        thumb=thumb,
-                        progress=ProgressManager.update_progress,
-                        progress_args=(
-                            client,
-                            user_id,
-                            progress_msg.id,
-                            start_time
-                        ),
-                        reply_to_message_id=reply_to_id
-                    )
+                    media_type = 'audio'
                 elif message.photo:
-                    await client.send_photo(
+                    media_type = 'photo'
+                else:
+                    media_type = 'document'
+            elif message.video or os.path.splitext(file_path)[1].lower() == '.mp4':
+                media_type = 'video'
+            elif message.video_note:
+                media_type = 'video_note'
+            elif message.voice:
+                media_type = 'voice'
+            elif message.sticker:
+                media_type = 'sticker'
+            elif message.audio:
+                media_type = 'audio'
+            elif message.photo:
+                media_type = 'photo'
+            else:
+                media_type = 'document'
+            item['media_type'] = media_type
+            
+            if media_type == 'video' or item['large']:
+                # One ffmpeg pass for size, duration and the midpoint thumbnail
+                hint = message.video.duration if message.video else 0
+                item['metadata'] = await probe_media(file_path, hint or 0)
+                item['thumb'] = item['thumb'] or item['metadata']['thumb']
+            item['status'] = 'file'
+        except Exception as e:
+            await MessageProcessor.fail(client, user_id, item, f'Upload failed: {str(e)[:30]}')
+
+    @staticmethod
+    async def fail(
+        client: Client,
+        user_id: int,
+        item: Dict[str, Any],
+        text: str
+    ) -> None:
+        """Mark an item as failed, report it and drop its file."""
+        item['status'] = 'failed'
+        item.setdefault('result', 'Failed.')
+        if item.get('progress_msg'):
+            ProgressManager.finish(user_id, item['progress_msg'].id)
+            try:
+                await client.edit_message_text(user_id, item['progress_msg'].id, text)
+            except Exception as e:
+                print(f"Error updating progress: {e}")
+        if item.get('file_path') and os.path.exists(item['file_path']):
+            os.remove(item['file_path'])
+        await storage.release(item.pop('storage', None))
+
+    @staticmethod
+    async def upload(
+        client: Client,
+        user_client: Client,
+        user_id: int,
+        item: Dict[str, Any]
+    ) -> str:
+        """Deliver a prepared item to its target chat (upload stage)."""
+        message = item['message']
+        target_chat_id = item['target_chat_id']
+        reply_to_id = item['reply_to_id']
+        final_text = item['final_text']
+        
+        if item['status'] == 'failed':
+            return item['result']
+        
+        if item['status'] == 'text':
+            await call_limited(
+                client, client.send_message,
+                target_chat_id,
+                text=message.text.markdown,
+                reply_to_message_id=reply_to_id
+            )
+            return 'Sent.'
+        
+        if item['status'] == 'direct':
+            if await MessageProcessor.send_direct(
+                client,
+                message,
+                target_chat_id,
+                final_text,
+                reply_to_id
+            ):
+                return 'Sent directly.'
+            # Fall back to download (or stream) and re-upload
+            item['status'] = 'pending'
+            await MessageProcessor.download(client, user_client, user_id, item)
+        
+        if item['status'] == 'cached':
+            cached = item['cached']
+            try:
+                if cached['file_id']:
+                    await call_limited(
+                        client, client.send_cached_media,
                         target_chat_id,
-                        photo=file_path,
-                        caption=final_text if message.caption else None,
-                        progress=ProgressManager.update_progress,
-                        progress_args=(
-                            client,
-                            user_id,
-                            progress_msg.id,
-                            start_time
+                        cached['file_id'],
+                        # Voice and video notes are uploaded without a caption
+                        caption=(
+                            final_text
+                            if message.caption and not (message.voice or message.video_note)
+                            else None
                         ),
                         reply_to_message_id=reply_to_id
                     )
                 else:
-                    await client.send_document(
+                    await call_limited(
+                        client, client.copy_message,
                         target_chat_id,
-                        document=file_path,
-                        caption=final_text if message.caption else None,
-                        progress=ProgressManager.update_progress,
-                        progress_args=(
-                            client,
-                            user_id,
-                            progress_msg.id,
-                            start_time
-                        ),
+                        cached['chat_id'] or LOG_GROUP,
+                        cached['message_id'],
                         reply_to_message_id=reply_to_id
                     )
-                
-                # Cleanup
-                os.remove(file_path)
-                await client.delete_messages(user_id, progress_msg.id)
-                
-                return 'Done.'
-                
+                return 'Copied (cached).'
             except Exception as e:
+                # The cached copy is gone: evict and upload again
+                print(f'Cached copy unavailable, evicting: {e}')
+                await evict_cached_media(item['cache_key'])
+                item['status'] = 'pending'
+                item['no_cache'] = True
+                await MessageProcessor.download(client, user_client, user_id, item)
+        
+        if item['status'] == 'stream':
+            if await MessageProcessor.relay(client, user_client, user_id, item):
+                return 'Done (Streamed).'
+            # Fall back to the disk path
+            item['status'] = 'pending'
+            item['no_stream'] = True
+            await MessageProcessor.download(client, user_client, user_id, item)
+        
+        if item['status'] == 'downloaded':
+            await MessageProcessor.post_process(client, user_id, item)
+        if item['status'] != 'file':
+            return item.get('result', 'Failed.')
+        
+        progress_msg = item['progress_msg']
+        file_path = item['file_path']
+        media_type = item['media_type']
+        metadata = item['metadata']
+        thumb = item['thumb']
+        progress_args = (
+            client,
+            user_id,
+            progress_msg.id,
+            item['start_time']
+        )
+        
+        try:
+            # Handle large files (>2GB)
+            if item['large']:
                 await client.edit_message_text(
                     user_id,
                     progress_msg.id,
-                    f'Upload failed: {str(e)[:30]}'
+                    'File is larger than 2GB. Using alternative method...'
+                )
+                
+                await ClientManager.resolve_chat_id(Y, LOG_GROUP)
+                
+                # Upload parts in parallel, then send to log group first
+                uploaded = await upload_file_parallel(
+                    Y,
+                    file_path,
+                    UPLOAD_WORKERS,
+                    ProgressManager.update_progress,
+                    progress_args
+                )
+                updates = await call_limited(
+                    Y, send_uploaded_document,
+                    Y,
+                    LOG_GROUP,
+                    uploaded,
+                    mimetypes.guess_type(file_path)[0] or getattr(
+                        MessageProcessor.media_of(message), 'mime_type', None
+                    ),
+                    MessageProcessor.large_attributes(item),
+                    caption=final_text if message.caption and media_type not in ['video_note', 'voice'] else None,
+                    thumb=thumb if media_type == 'video' else None
+                )
+                sent_id = sent_message_id(updates)
+                if not sent_id:
+                    raise ValueError('Large upload sent no message')
+                
+                # Copy to target chat
+                await call_limited(
+                    client, client.copy_message,
+                    target_chat_id,
+                    LOG_GROUP,
+                    sent_id,
+                    reply_to_message_id=reply_to_id
                 )
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                return 'Failed.'
+                # Sent by the userbot: its file_id is no use to the bot
+                await MessageProcessor.remember(item, LOG_GROUP, sent_id)
+                
+                # Cleanup
+                os.remove(file_path)
+                await storage.release(item.pop('storage', None))
+                ProgressManager.finish(user_id, progress_msg.id)
+                await client.delete_messages(user_id, progress_msg.id)
                 
+                return 'Done (Large file).'
+            
+            # Upload normally for smaller files
+            await client.edit_message_text(user_id, progress_msg.id, 'Uploading...')
+            
+            if media_type == 'video':
+                sent = await call_limited(
+                    client, client.send_video,
+                    target_chat_id,
+                    video=file_path,
+                    caption=final_text if message.caption else None,
+                    thumb=thumb,
+                    width=metadata['width'],
+                    height=metadata['height'],
+                    duration=metadata['duration'],
+                    progress=ProgressManager.update_progress,
+                    progress_args=progress_args,
+                    reply_to_message_id=reply_to_id
+                )
+            elif media_type == 'video_note':
+                sent = await call_limited(
+                    client, client.send_video_note,
+                    target_chat_id,
+                    video_note=file_path,
+                    progress=ProgressManager.update_progress,
+                    progress_args=progress_args,
+                    reply_to_message_id=reply_to_id
+                )
+            elif media_type == 'voice':
+                sent = await call_limited(
+                    client, client.send_voice,
+                    target_chat_id,
+                    voice=file_path,
+                    progress=ProgressManager.update_progress,
+                    progress_args=progress_args,
+                    reply_to_message_id=reply_to_id
+                )
+            elif media_type == 'sticker':
+                sent = await call_limited(
+                    client, client.send_sticker,
+                    target_chat_id,
+                    message.sticker.file_id
+                )
+            elif media_type == 'audio':
+                sent = await call_limited(
+                    client, client.send_audio,
+                    target_chat_id,
+                    audio=file_path,
+                    caption=final_text if message.caption else None,
+                    thumb=thumb,
+                    progress=ProgressManager.update_progress,
+                    progress_args=progress_args,
+                    reply_to_message_id=reply_to_id
+                )
+            elif media_type == 'photo':
+                sent = await call_limited(
+                    client, client.send_photo,
+                    target_chat_id,
+                    photo=file_path,
+                    caption=final_text if message.caption else None,
+                    progress=ProgressManager.update_progress,
+                    progress_args=progress_args,
+                    reply_to_message_id=reply_to_id
+                )
+            else:
+                sent = await call_limited(
+                    client, client.send_document,
+                    target_chat_id,
+                    document=file_path,
+                    caption=final_text if message.caption else None,
+                    progress=ProgressManager.update_progress,
+                    progress_args=progress_args,
+                    reply_to_message_id=reply_to_id
+                )
+            
+            await MessageProcessor.remember(item, target_chat_id, sent.id, sent)
+            
+            # Cleanup
+            os.remove(file_path)
+            await storage.release(item.pop('storage', None))
+            ProgressManager.finish(user_id, progress_msg.id)
+            await client.delete_messages(user_id, progress_msg.id)
+            
+            return 'Done.'
+            
+        except Exception as e:
+            await MessageProcessor.fail(client, user_id, item, f'Upload failed: {str(e)[:30]}')
+            return 'Failed.'
+
+    @staticmethod
+    def large_attributes(item: Dict[str, Any]) -> List[Any]:
+        """Document attributes for a file sent through the raw userbot path."""
+        message = item['message']
+        metadata = item['metadata']
+        attributes = [raw.types.DocumentAttributeFilename(
+            file_name=os.path.basename(item['file_path'])
+        )]
+        if item['media_type'] == 'video':
+            attributes.append(raw.types.DocumentAttributeVideo(
+                duration=metadata['duration'],
+                w=metadata['width'],
+                h=metadata['height'],
+                supports_streaming=True
+            ))
+        elif item['media_type'] == 'video_note':
+            attributes.append(raw.types.DocumentAttributeVideo(
+                duration=message.video_note.duration or metadata['duration'],
+                w=message.video_note.length or metadata['width'],
+                h=message.video_note.length or metadata['height'],
+                round_message=True
+            ))
+        elif item['media_type'] == 'voice':
+            attributes.append(raw.types.DocumentAttributeAudio(
+                duration=message.voice.duration or metadata['duration'],
+                voice=True,
+                waveform=message.voice.waveform
+            ))
+        elif item['media_type'] == 'audio' and message.audio:
+            attributes.append(raw.types.DocumentAttributeAudio(
+                duration=message.audio.duration or 0,
+                title=message.audio.title,
+                performer=message.audio.performer
+            ))
+        return attributes
+
+    @staticmethod
+    def album_media(item: Dict[str, Any]) -> Optional[Any]:
+        """Build the InputMedia for one album member, or None if it can't be grouped."""
+        message = item['message']
+        caption = item['final_text'] if message.caption else None
+        
+        if item['status'] == 'direct':
+            if message.photo:
+                return InputMediaPhoto(message.photo.file_id, caption=caption)
+            if message.video:
+                return InputMediaVideo(message.video.file_id, caption=caption)
+            if message.audio:
+                return InputMediaAudio(message.audio.file_id, caption=caption)
+            if message.document:
+                return InputMediaDocument(message.document.file_id, caption=caption)
+            return None
+        
+        file_path = item['file_path']
+        media_type = item['media_type']
+        metadata = item['metadata']
+        if media_type == 'photo':
+            return InputMediaPhoto(file_path, caption=caption)
+        if media_type == 'video':
+            return InputMediaVideo(
+                file_path,
+                thumb=item['thumb'],
+                caption=caption,
+                width=metadata['width'],
+                height=metadata['height'],
+                duration=metadata['duration'],
+                supports_streaming=True
+            )
+        if media_type == 'audio':
+            return InputMediaAudio(file_path, thumb=item['thumb'], caption=caption)
+        if media_type == 'document':
+            return InputMediaDocument(file_path, thumb=item['thumb'], caption=caption)
+        return None
+
+    @staticmethod
+    async def upload_album(
+        client: Client,
+        user_id: int,
+        items: List[Dict[str, Any]]
+    ) -> Optional[List[str]]:
+        """
+        Send album members with a single send_media_group call.
+        Returns one result per item, or None if the members can't be sent
+        as one group; the caller then delivers them one by one.
+        """
+        if any(item['status'] not in ('file', 'direct') or item.get('large') for item in items):
+            return None
+        if len({item['target_chat_id'] for item in items}) > 1:
+            return None
+        
+        media = [MessageProcessor.album_media(item) for item in items]
+        kinds = {type(m) for m in media}
+        if not (
+            kinds <= {InputMediaPhoto, InputMediaVideo}
+            or kinds == {InputMediaAudio}
+            or kinds == {InputMediaDocument}
+        ):
+            return None
+        
+        first = items[0]
+        try:
+            await call_limited(
+                client, client.send_media_group,
+                first['target_chat_id'],
+                media,
+                reply_to_message_id=first['reply_to_id']
+            )
+        except Exception as e:
+            print(f'Album send failed, sending items one by one: {e}')
+            return None
+        
+        # Cleanup
+        for item in items:
+            if item.get('progress_msg'):
+                ProgressManager.finish(user_id, item['progress_msg'].id)
+                await client.delete_messages(user_id, item['progress_msg'].id)
+            if item.get('file_path') and os.path.exists(item['file_path']):
+                os.remove(item['file_path'])
+            await storage.release(item.pop('storage', None))
+        return ['Done (Album).'] * len(items)
+
+    @staticmethod
+    async def process_message(
+        client: Client,
+        user_client: Client,
+        message: Message,
+        user_id: int,
+        chat_id: str,
+        message_id: int,
+        link_type: str,
+        target_chat_id: int
+    ) -> str:
+        """Process a single message through all stages in sequence."""
+        try:
+            item = await MessageProcessor.prepare(user_id, message, link_type, target_chat_id)
+            await MessageProcessor.download(client, user_client, user_id, item)
+            await MessageProcessor.post_process(client, user_id, item)
+            return await MessageProcessor.upload(client, user_client, user_id, item)
         except Exception as e:
             return f'Error: {str(e)[:50]}'
 
+class BatchPipeline:
+    """
+    Staged batch engine: fetch -> download -> post-process -> upload.
+    Bounded queues sit between the stages so item N+1 downloads while
+    item N uploads; the upload stage delivers strictly in batch order.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        user_bot: Client,
+        user_client: Client,
+        user_id: int,
+        state: Dict[str, Any],
+        progress_msg: Message,
+        workers: int,
+        start: int = 0,
+        success: int = 0,
+        job: Optional[ScheduledJob] = None
+    ) -> None:
+        self.client = client
+        self.job = job
+        self.user_bot = user_bot
+        self.user_client = user_client
+        self.user_id = user_id
+        self.state = state
+        self.progress_msg = progress_msg
+        self.total = state['count']
+        self.start = start
+        self.created = time.monotonic()
+        self.workers = max(1, min(workers, self.total - start))
+        self.processors = max(1, self.workers // 2)
+        
+        # Batch index -> (unit, offset); each unit gets its own prefetcher
+        self.units = state['units']
+        self.offsets = []
+        offset = 0
+        for unit in self.units:
+            self.offsets.append(offset)
+            offset += unit['count']
+        self.prefetchers: Dict[int, MessagePrefetcher] = {}
+        
+        # Queue depths bound how many files can sit on disk at once
+        self.download_q: asyncio.Queue = asyncio.Queue(maxsize=self.workers)
+        self.process_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+        self.upload_q: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+        self.in_flight = asyncio.Semaphore(self.workers + 2 * PIPELINE_QUEUE_DEPTH)
+        
+        self.done = start
+        self.success = success
+
+    async def _report_error(self, index: int, error: Exception) -> None:
+        try:
+            await self.progress_msg.edit(
+                f'{index+1}/{self.total}: Error - {str(error)[:30]}'
+            )
+        except:
+            pass
+
+    def _unit_of(self, i: int) -> int:
+        return bisect_right(self.offsets, i) - 1
+
+    def _unit_end(self, i: int) -> int:
+        """Batch index just past the unit that item i belongs to."""
+        unit = self._unit_of(i)
+        return self.offsets[unit] + self.units[unit]['count']
+
+    async def _get_message(self, i: int) -> Optional[Message]:
+        unit_index = self._unit_of(i)
+        unit = self.units[unit_index]
+        prefetcher = self.prefetchers.get(unit_index)
+        if prefetcher is None:
+            # Earlier units are finished by now: stop their prefetches
+            for old in [u for u in self.prefetchers if u < unit_index]:
+                self.prefetchers.pop(old).close()
+            offset = i - self.offsets[unit_index]
+            prefetcher = self.prefetchers[unit_index] = MessagePrefetcher(
+                self.user_bot,
+                self.user_client,
+                unit['chat_id'],
+                unit['link_type'],
+                int(unit['message_id']) + offset,
+                unit['count'] - offset
+            )
+        return await prefetcher.get(int(unit['message_id']) + i - self.offsets[unit_index])
+
+    async def _fetch_item(self, i: int) -> Dict[str, Any]:
+        item = {'index': i, 'status': 'skipped', 'result': 'Not found.'}
+        try:
+            # Local version check; reloads only after a settings edit
+            self.settings = await refresh_user_settings(self.settings)
+            msg = await self._get_message(i)
+            if msg:
+                item = await MessageProcessor.prepare(
+                    self.user_id,
+                    msg,
+                    self.units[self._unit_of(i)]['link_type'],
+                    self.state['target_chat_id'],
+                    self.settings
+                )
+                item['index'] = i
+        except Exception as e:
+            item['result'] = f'Error: {str(e)[:50]}'
+            await self._report_error(i, e)
+        return item
+
+    async def _in_group(self, i: int, group_id: str) -> bool:
+        """Check whether message i of the batch belongs to media group group_id."""
+        try:
+            msg = await self._get_message(i)
+        except Exception:
+            return False
+        return bool(msg and msg.media_group_id == group_id)
+
+    async def _fetch_stage(self) -> None:
+        """
+        Walk the range in order and hand messages to the downloaders.
+        Consecutive members of a media group travel as one album unit.
+        """
+        try:
+            i = self.start
+            while i < self.total:
+                if BatchManager.should_cancel(self.user_id):
+                    break
+                await self.in_flight.acquire()
+                
+                item = await self._fetch_item(i)
+                unit_end = self._unit_end(i)
+                i += 1
+                group_id = item.get('media_group_id')
+                if group_id:
+                    members = [item]
+                    while i < unit_end and len(members) < ALBUM_MAX and await self._in_group(i, group_id):
+                        members.append(await self._fetch_item(i))
+                        i += 1
+                    if len(members) > 1:
+                        # Albums are sent from local files or file IDs in one call
+                        for member in members:
+                            member['no_cache'] = member['no_stream'] = True
+                        item = {'index': members[0]['index'], 'status': 'album', 'members': members}
+                await self.download_q.put(item)
+        finally:
+            for _ in range(self.workers):
+                await self.download_q.put(None)
+
+    async def _download(self, item: Dict[str, Any]) -> None:
+        if item['status'] != 'pending':
+            return
+        try:
+            await MessageProcessor.download(
+                self.client, self.user_client, self.user_id, item
+            )
+        except Exception as e:
+            await MessageProcessor.fail(self.client, self.user_id, item, str(e)[:30])
+            await self._report_error(item['index'], e)
+
+    async def _download_stage(self) -> None:
+        while (item := await self.download_q.get()) is not None:
+            # Album members download concurrently
+            await asyncio.gather(*(self._download(m) for m in item.get('members', [item])))
+            await self.process_q.put(item)
+
+    async def _process_stage(self) -> None:
+        while (item := await self.process_q.get()) is not None:
+            for member in item.get('members', [item]):
+                if member['status'] == 'downloaded':
+                    await MessageProcessor.post_process(self.client, self.user_id, member)
+            await self.upload_q.put(item)
+
+    async def _upload_stage(self) -> None:
+        """Reorder finished items and deliver them in batch order."""
+        pending: Dict[int, Dict[str, Any]] = {}
+        next_index = self.start
+        while (item := await self.upload_q.get()) is not None:
+            pending[item['index']] = item
+            while next_index in pending:
+                item = pending.pop(next_index)
+                if item['status'] == 'album':
+                    next_index += len(item['members'])
+                    await self._deliver_album(item)
+                else:
+                    next_index += 1
+                    await self._deliver(item)
+
+    async def _deliver(
+        self,
+        item: Dict[str, Any],
+        result: Optional[str] = None,
+        release: bool = True
+    ) -> None:
+        try:
+            if result is None and item['status'] != 'skipped':
+                result = await MessageProcessor.upload(
+                    self.client, self.user_client, self.user_id, item
+                )
+            if result and any(s in result for s in ['Done', 'Copied', 'Sent']):
+                if self.done == self.start:
+                    StartupMetrics.record_first_message(self.user_id, time.monotonic() - self.created)
+                self.success += 1
+        except Exception as e:
+            await MessageProcessor.fail(self.client, self.user_id, item, str(e)[:30])
+            await self._report_error(item['index'], e)
+        finally:
+            self.done += 1
+            if release:
+                self.in_flight.release()
+            if self.job:
+                SCHEDULER.progress(self.job, self.total - self.done)
+            await BatchManager.update_batch_progress(self.user_id, self.done, self.success)
+
+    async def _deliver_album(self, album: Dict[str, Any]) -> None:
+        """Deliver an album in one send, or member by member if that fails."""
+        members = album['members']
+        try:
+            results = await MessageProcessor.upload_album(self.client, self.user_id, members)
+        except Exception as e:
+            print(f'Error sending album: {e}')
+            results = None
+        try:
+            for member, result in zip(members, results or [None] * len(members)):
+                await self._deliver(member, result, release=False)
+        finally:
+            self.in_flight.release()
+
+    @staticmethod
+    async def _run_pool(worker, count: int, next_q: asyncio.Queue, next_count: int) -> None:
+        """Run `count` stage workers, then signal the next stage to stop."""
+        try:
+            await asyncio.gather(*(worker() for _ in range(count)))
+        finally:
+            for _ in range(next_count):
+                await next_q.put(None)
+
+    async def run(self) -> None:
+        """Run all stages until the range is exhausted or cancelled."""
+        try:
+            self.settings = await load_user_settings(self.user_id)
+            await asyncio.gather(
+                self._fetch_stage(),
+                self._run_pool(self._download_stage, self.workers, self.process_q, self.processors),
+                self._run_pool(self._process_stage, self.processors, self.upload_q, 1),
+                self._upload_stage()
+            )
+        finally:
+            for prefetcher in self.prefetchers.values():
+                prefetcher.close()
+
 # Initialize active users
 ACTIVE_USERS = BatchManager.load_active_users()
 
@@ -661,7 +1887,7 @@ async def handle_batch_command(client: Client, message: Message) -> None:
     progress_msg = await message.reply_text('Doing some checks, please wait...')
     
     # Check for active tasks
-    if BatchManager.is_user_active(user_id):
+    if await BatchManager.has_active_batch(user_id):
         await progress_msg.edit('You have an active task. Use /stop to cancel it.')
         return
     
@@ -678,7 +1904,9 @@ async def handle_batch_command(client: Client, message: Message) -> None:
     }
     
     await progress_msg.edit(
-        f"Send {'the start link...' if command == 'batch' else 'the link to process'}"
+        'Send the start link, or several links and ranges at once, one per line '
+        '(e.g. https://t.me/c/123/100-450)...' if command == 'batch'
+        else 'Send the link to process'
     )
 
 @X.on_message(filters.command(['cancel', 'stop']))
@@ -686,8 +1914,15 @@ async def handle_cancel_command(client: Client, message: Message) -> None:
     """Handle /cancel and /stop commands."""
     user_id = message.from_user.id
     
-    if BatchManager.is_user_active(user_id):
-        if await BatchManager.request_batch_cancel(user_id):
+    if JOB_QUEUE and await request_job_cancel(user_id):
+        await message.reply_text(
+            'Cancellation requested. Queued batches stop now, running ones '
+            'after the current download completes.'
+        )
+    elif BatchManager.is_user_active(user_id):
+        if SCHEDULER.cancel_user(user_id):
+            await message.reply_text('Your queued batch was cancelled.')
+        elif await BatchManager.request_batch_cancel(user_id):
             await message.reply_text(
                 'Cancellation requested. The current batch will stop after '
                 'the current download completes.'
@@ -718,7 +1953,31 @@ async def handle_text_message(client: Client, message: Message) -> None:
     state = Z[user_id].get('step')
     text = message.text.strip()
     
-    if state == 'start' or state == 'start_single':
+    if state == 'start':
+        units = parse_batch_links(text)
+        if not units:
+            await message.reply_text('Invalid link format.')
+            Z.pop(user_id, None)
+            return
+        
+        if len(units) > 1 or units[0]['count'] > 1:
+            # Links and ranges define the whole batch: no count step
+            count = sum(unit['count'] for unit in units)
+            if not await check_batch_limit(message, user_id, count):
+                return
+            Z[user_id].update({
+                'step': 'process',
+                'target_chat_id': str(message.chat.id),
+                'units': units,
+                'count': count
+            })
+            await process_batch_messages(client, message, user_id)
+            return
+        
+        Z[user_id].update({'step': 'count', **units[0]})
+        await message.reply_text('How many messages?')
+    
+    elif state == 'start_single':
         # Parse the Telegram link
         chat_id, message_id, link_type = parse_telegram_link(text)
         if not chat_id or not message_id:
@@ -727,16 +1986,12 @@ async def handle_text_message(client: Client, message: Message) -> None:
             return
             
         Z[user_id].update({
-            'step': 'count' if state == 'start' else 'process_single',
+            'step': 'process_single',
             'chat_id': chat_id,
             'message_id': message_id,
             'link_type': link_type
         })
-        
-        if state == 'start':
-            await message.reply_text('How many messages?')
-        else:
-            await process_single_message(client, message, user_id)
+        await process_single_message(client, message, user_id)
             
     elif state == 'count':
         if not text.isdigit():
@@ -744,25 +1999,33 @@ async def handle_text_message(client: Client, message: Message) -> None:
             return
             
         count = int(text)
-        max_limit = (
-            PREMIUM_LIMIT if await is_premium_user(user_id)
-            else FREEMIUM_LIMIT
-        )
-        
-        if count > max_limit:
-            await message.reply_text(
-                f'Maximum limit is {max_limit} for your account type.'
-            )
+        if not await check_batch_limit(message, user_id, count):
             return
             
+        unit = {k: Z[user_id][k] for k in ('chat_id', 'link_type', 'message_id')}
         Z[user_id].update({
             'step': 'process',
             'target_chat_id': str(message.chat.id),
+            'units': [{**unit, 'count': count}],
             'count': count
         })
         
         await process_batch_messages(client, message, user_id)
 
+async def check_batch_limit(message: Message, user_id: int, count: int) -> bool:
+    """Check a batch size against the user's limit, replying if it is too big."""
+    max_limit = (
+        PREMIUM_LIMIT if await is_premium_user(user_id)
+        else FREEMIUM_LIMIT
+    )
+    
+    if count > max_limit:
+        await message.reply_text(
+            f'Maximum limit is {max_limit} for your account type.'
+        )
+        return False
+    return True
+
 async def process_single_message(
     client: Client,
     message: Message,
@@ -770,9 +2033,10 @@ async def process_single_message(
 ) -> None:
     """Process a single message from a link."""
     state = Z[user_id]
+    requested = time.monotonic()
     progress_msg = await message.reply_text('Processing...')
     
-    user_bot = UB.get(user_id)
+    user_bot = await ClientManager.get_user_bot(user_id)
     if not user_bot:
         await progress_msg.edit('Please add your bot with /setbot first')
         Z.pop(user_id, None)
@@ -784,11 +2048,13 @@ async def process_single_message(
         Z.pop(user_id, None)
         return
         
-    if BatchManager.is_user_active(user_id):
+    if await BatchManager.has_active_batch(user_id):
         await progress_msg.edit('You have an active task. Use /stop first.')
         Z.pop(user_id, None)
         return
     
+    UB.acquire(user_id)
+    UC.acquire(user_id)
     try:
         msg = await ClientManager.get_message(
             user_bot,
@@ -809,12 +2075,15 @@ async def process_single_message(
                 state['link_type'],
                 state.get('target_chat_id', str(message.chat.id))
             )
+            StartupMetrics.record_first_message(user_id, time.monotonic() - requested)
             await progress_msg.edit(f'1/1: {result}')
         else:
             await progress_msg.edit('Message not found')
     except Exception as e:
         await progress_msg.edit(f'Error: {str(e)[:50]}')
     finally:
+        UB.release(user_id)
+        UC.release(user_id)
         Z.pop(user_id, None)
 
 async def process_batch_messages(
@@ -826,7 +2095,8 @@ async def process_batch_messages(
     state = Z[user_id]
     progress_msg = await message.reply_text('Processing batch...')
     
-    user_bot = state.get('client')
+    # Re-resolve through the pool: the bot may have been evicted while idle
+    user_bot = state.get('client') and await ClientManager.get_user_bot(user_id)
     user_client = await ClientManager.get_user_client(user_id)
     
     if not user_client or not user_bot:
@@ -834,73 +2104,241 @@ async def process_batch_messages(
         Z.pop(user_id, None)
         return
         
-    if BatchManager.is_user_active(user_id):
+    if await BatchManager.has_active_batch(user_id):
         await progress_msg.edit('You already have an active task')
         Z.pop(user_id, None)
         return
     
-    # Initialize batch tracking
-    await BatchManager.add_active_batch(user_id, {
+    # Initialize batch tracking (everything needed to resume after a restart)
+    batch_info = {
         "total": state['count'],
         "current": 0,
         "success": 0,
         "cancel_requested": False,
-        "progress_message_id": progress_msg.id
-    })
+        "progress_message_id": progress_msg.id,
+        "units": state['units'],
+        "chat_id": state['units'][0]['chat_id'],
+        "message_id": int(state['units'][0]['message_id']),
+        "link_type": state['units'][0]['link_type'],
+        "target_chat_id": state['target_chat_id']
+    }
+    
+    if JOB_QUEUE:
+        Z.pop(user_id, None)
+        if await enqueue_job(user_id, batch_info):
+            await progress_msg.edit('Batch queued. A worker will start it shortly; use /stop to cancel.')
+        else:
+            await progress_msg.edit('Could not queue the batch. Please try again.')
+        return
     
-    success_count = 0
+    await BatchManager.add_active_batch(user_id, batch_info)
+    Z.pop(user_id, None)
     
+    spawn_batch(run_batch(client, user_id, batch_info, progress_msg, user_bot, user_client))
+
+def spawn_batch(coro) -> None:
+    """Run a batch as a background task so the handler returns immediately."""
+    task = asyncio.create_task(coro)
+    BATCH_TASKS.add(task)
+    task.add_done_callback(BATCH_TASKS.discard)
+
+def batch_units(batch_info: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Work units of a batch; batches from before multi-link support have one."""
+    return batch_info.get('units') or [{
+        'chat_id': batch_info['chat_id'],
+        'link_type': batch_info['link_type'],
+        'message_id': batch_info['message_id'],
+        'count': batch_info['total']
+    }]
+
+async def run_batch(
+    client: Client,
+    user_id: int,
+    batch_info: Dict[str, Any],
+    progress_msg: Message,
+    user_bot: Client,
+    user_client: Client
+) -> None:
+    """Run a registered batch from its cursor until done or cancelled."""
+    total = batch_info['total']
+    state = {
+        'units': batch_units(batch_info),
+        'target_chat_id': batch_info['target_chat_id'],
+        'count': total
+    }
+    premium = await is_premium_user(user_id)
+    workers = BATCH_WORKERS_PREMIUM if premium else BATCH_WORKERS_FREE
+    
+    # Pin the clients so the pool never evicts them while queued or running
+    UB.acquire(user_id)
+    UC.acquire(user_id)
+    job = SCHEDULER.submit(user_id, total - batch_info.get('current', 0), premium)
     try:
-        for i in range(state['count']):
-            if BatchManager.should_cancel(user_id):
-                await progress_msg.edit(
-                    f'Cancelled at {i}/{state["count"]}. Success: {success_count}'
-                )
-                break
-                
-            await BatchManager.update_batch_progress(user_id, i, success_count)
-            
-            current_message_id = int(state['message_id']) + i
-            
-            try:
-                msg = await ClientManager.get_message(
-                    user_bot,
-                    user_client,
-                    state['chat_id'],
-                    current_message_id,
-                    state['link_type']
-                )
-                
-                if msg:
-                    result = await MessageProcessor.process_message(
-                        client,
-                        user_client,
-                        msg,
-                        user_id,
-                        state['chat_id'],
-                        current_message_id,
-                        state['link_type'],
-                        state['target_chat_id']
-                    )
-                    
-                    if any(s in result for s in ['Done', 'Copied', 'Sent']):
-                        success_count += 1
-                else:
-                    pass  # Message not found, skip
-            except Exception as e:
-                try:
-                    await progress_msg.edit(
-                        f'{i+1}/{state["count"]}: Error - {str(e)[:30]}'
-                    )
-                except:
-                    pass
-                
-            await asyncio.sleep(10)  # Rate limiting
-            
-        if i + 1 == state['count']:
-            await message.reply_text(
-                f'Batch Completed ✅ Success: {success_count}/{state["count"]}'
+        if not job.ready.is_set():
+            await progress_msg.edit(
+                f'Queued at position {SCHEDULER.position(job)}. '
+                f'Use /status to check your place in the queue.'
+            )
+        if not await SCHEDULER.wait(job):
+            await progress_msg.edit('Batch cancelled while queued.')
+            return
+        
+        pipeline = BatchPipeline(
+            client,
+            user_bot,
+            user_client,
+            user_id,
+            state,
+            progress_msg,
+            workers,
+            start=batch_info.get('current', 0),
+            success=batch_info.get('success', 0),
+            job=job
+        )
+        await pipeline.run()
+        
+        if BatchManager.should_cancel(user_id):
+            await progress_msg.edit(
+                f'Cancelled at {pipeline.done}/{total}. '
+                f'Success: {pipeline.success}'
+            )
+        else:
+            await client.send_message(
+                user_id,
+                f'Batch Completed ✅ Success: {pipeline.success}/{total}'
             )
     finally:
+        SCHEDULER.finish(job)
+        UB.release(user_id)
+        UC.release(user_id)
+        await BatchManager.remove_active_batch(user_id)
+
+def last_committed(batch_info: Dict[str, Any]) -> str:
+    """`chat/message` of the last delivered item of a batch, or '-'."""
+    remaining = batch_info.get('current', 0)
+    for unit in batch_units(batch_info):
+        if remaining <= unit['count']:
+            if remaining == 0:
+                break
+            return f"{unit['chat_id']}/{unit['message_id'] + remaining - 1}"
+        remaining -= unit['count']
+    return '-'
+
+async def resume_batch(client: Client, user_id: int, batch_info: Dict[str, Any]) -> None:
+    """Resume a batch interrupted by a restart from its last committed message."""
+    try:
+        user_bot = await ClientManager.get_user_bot(user_id)
+        user_client = await ClientManager.get_user_client(user_id)
+        if not user_bot or not user_client:
+            await BatchManager.remove_active_batch(user_id)
+            await client.send_message(
+                user_id,
+                'Your batch was interrupted by a restart and could not be resumed. '
+                'Please start it again.'
+            )
+            return
+        
+        progress_msg = await client.send_message(
+            user_id,
+            f'Resuming your batch after a restart '
+            f'({batch_info.get("current", 0)}/{batch_info["total"]} done, '
+            f'last committed message: {last_committed(batch_info)})...'
+        )
+        await run_batch(client, user_id, batch_info, progress_msg, user_bot, user_client)
+    except Exception as e:
+        print(f"Error resuming batch for user {user_id}: {e}")
         await BatchManager.remove_active_batch(user_id)
-        Z.pop(user_id, None)
\ No newline at end of file
+
+async def job_heartbeat(job: Dict[str, Any], batch_info: Dict[str, Any], outcome: Dict[str, str]) -> None:
+    """Keep a job's lease alive, store its progress and pick up cancellation."""
+    user_id = job['user_id']
+    while True:
+        await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            doc = await heartbeat_job(
+                job['_id'],
+                WORKER_ID,
+                JOB_LEASE_SECONDS,
+                {'current': batch_info.get('current', 0), 'success': batch_info.get('success', 0)}
+            )
+        except Exception as e:
+            # Transient DB error: the lease is still ours until it expires
+            print(f"Heartbeat of job {job['_id']} failed, retrying: {e}")
+            continue
+        if doc is None:
+            # Another worker reclaimed the job; stop without committing
+            outcome['status'] = 'lost'
+            await BatchManager.request_batch_cancel(user_id)
+            return
+        if doc.get('cancel_requested') and outcome['status'] != 'cancelled':
+            outcome['status'] = 'cancelled'
+            await BatchManager.request_batch_cancel(user_id)
+
+async def run_job(client: Client, job: Dict[str, Any]) -> None:
+    """Run one claimed job from the queue, resuming from its stored progress."""
+    user_id = job['user_id']
+    batch_info = {**job['batch'], **job.get('progress', {}), 'cancel_requested': False}
+    outcome = {'status': 'running'}
+    heartbeat = asyncio.create_task(job_heartbeat(job, batch_info, outcome))
+    try:
+        user_bot = await ClientManager.get_user_bot(user_id)
+        user_client = await ClientManager.get_user_client(user_id)
+        if not user_bot or not user_client:
+            outcome['status'] = 'failed'
+            await client.send_message(user_id, 'Your batch could not start: missing client setup.')
+            return
+        
+        progress_msg = await client.send_message(
+            user_id,
+            f'Starting your batch ({batch_info.get("current", 0)}/{batch_info["total"]} done)...'
+        )
+        await BatchManager.add_active_batch(user_id, batch_info)
+        await run_batch(client, user_id, batch_info, progress_msg, user_bot, user_client)
+        if outcome['status'] == 'running':
+            outcome['status'] = 'done'
+    except Exception as e:
+        print(f"Error running job for user {user_id}: {e}")
+        outcome['status'] = 'failed'
+    finally:
+        heartbeat.cancel()
+        if outcome['status'] != 'lost':
+            await complete_job(
+                job['_id'],
+                WORKER_ID,
+                outcome['status'],
+                {'current': batch_info.get('current', 0), 'success': batch_info.get('success', 0)}
+            )
+
+def start_pool_sweeper() -> None:
+    """Start the client pool sweeper once per process."""
+    global POOL_SWEEPER
+    if POOL_SWEEPER is None or POOL_SWEEPER.done():
+        POOL_SWEEPER = asyncio.create_task(run_pool_sweeper(UB, UC))
+
+async def run_worker() -> None:
+    """Worker mode: claim batch jobs from the queue and run them, nothing else."""
+    print(f"Worker {WORKER_ID} waiting for jobs...")
+    start_pool_sweeper()
+    start_storage_sweeper()
+    while True:
+        if len(BATCH_TASKS) >= MAX_CONCURRENT_BATCHES:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+        job = await claim_job(WORKER_ID, JOB_LEASE_SECONDS)
+        if not job:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+        print(f"Claimed job {job['_id']} of user {job['user_id']} (attempt {job['attempts']})")
+        spawn_batch(run_job(X, job))
+
+async def run_batch_plugin() -> None:
+    """Start the client pool sweeper and resume batches interrupted by a restart."""
+    start_pool_sweeper()
+    start_storage_sweeper()
+    
+    for user, batch_info in list(ACTIVE_USERS.items()):
+        if 'chat_id' not in batch_info:
+            await BatchManager.remove_active_batch(int(user))
+            continue
+        print(f"Resuming batch for user {user} at {batch_info.get('current', 0)}/{batch_info['total']}")
+        spawn_batch(resume_batch(X, int(user), batch_info))
@@ -21,6 +21,7 @@ from utils.func import (
 )
 from utils.encrypt import ecs, dcs
 from plugins.batch import UB, UC
+from utils.sessions import drop_session_file
 from utils.custom_filters import (
     login_in_progress,
     set_user_step,
@@ -426,13 +427,8 @@ async def logout_command(client: Client, message: Message) -> None:
         if UC.get(user_id, None):
             del UC[user_id]
             
-        # Remove session file if exists
-        try:
-            session_file = f"{user_id}_client.session"
-            if os.path.exists(session_file):
-                os.remove(session_file)
-        except Exception as e:
-            logger.error(f"Error removing session file: {e}")
+        # Remove the persisted session file and its fingerprint
+        drop_session_file(f"{user_id}_client")
             
         await LoginManager.edit_message_safely(
             status_msg,
@@ -444,6 +440,7 @@ async def logout_command(client: Client, message: Message) -> None:
             await remove_user_session(user_id)
             if UC.get(user_id, None):
                 del UC[user_id]
+            drop_session_file(f"{user_id}_client")
         except Exception as e:
             logger.error(f'Error during cleanup: {e}')
             
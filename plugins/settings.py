@@ -7,7 +7,14 @@ from typing import Dict, Optional, Tuple
 from telethon import events, Button
 from shared_client import client as gf
 from config import OWNER_ID
-from utils.func import get_user_data_key, save_user_data, users_collection
+from utils.func import (
+    get_user_data_key,
+    save_user_data,
+    unset_user_data,
+    get_text_rules,
+    UserSettings
+)
+from utils.thumbnails import thumbnails
 
 # Constants
 VIDEO_EXTENSIONS = {
@@ -55,22 +62,22 @@ class SettingsManager:
     async def reset_user_settings(user_id: int) -> bool:
         """Reset all settings for a user."""
         try:
-            # Clear database settings
-            await users_collection.update_one(
-                {'user_id': user_id},
-                {'$unset': {
-                    'delete_words': '',
-                    'replacement_words': '',
-                    'rename_tag': '',
-                    'caption': '',
-                    'chat_id': ''
-                }}
-            )
+            # Clear database settings (and the cached copy)
+            if await unset_user_data(
+                user_id,
+                'delete_words',
+                'replacement_words',
+                'rename_tag',
+                'caption',
+                'chat_id'
+            ) is None:
+                return False
             
             # Remove thumbnail file if exists
             thumbnail_path = f'{user_id}.jpg'
             if os.path.exists(thumbnail_path):
                 os.remove(thumbnail_path)
+            thumbnails.invalidate(user_id)
                 
             return True
         except Exception as e:
@@ -226,8 +233,10 @@ class ConversationHandler:
             return
             
         try:
-            thumb_path = f'{user_id}.jpg'
-            await event.download_media(file=thumb_path)
+            # Scaled once to Telegram's 320px/200KB limit, then served from memory
+            upload_path = f'{user_id}_upload.jpg'
+            await event.download_media(file=upload_path)
+            await thumbnails.store(user_id, upload_path)
             await event.respond('✅ Thumbnail saved!')
         except Exception as e:
             await event.respond(f'❌ Error saving thumbnail: {str(e)}')
@@ -245,11 +254,8 @@ async def callback_handler(event):
     user_id = event.sender_id
     
     if event.data == b'logout':
-        result = await users_collection.update_one(
-            {'user_id': user_id},
-            {'$unset': {'session_string': ''}}
-        )
-        response = '✅ Logged out' if result.modified_count else '❌ Not logged in'
+        modified = await unset_user_data(user_id, 'session_string')
+        response = '✅ Logged out' if modified else '❌ Not logged in'
         await event.respond(response)
     elif event.data == b'reset':
         success = await SettingsManager.reset_user_settings(user_id)
@@ -258,6 +264,7 @@ async def callback_handler(event):
         )
     elif event.data == b'remthumb':
         thumb_path = f'{user_id}.jpg'
+        thumbnails.invalidate(user_id)
         try:
             os.remove(thumb_path)
             await event.respond('✅ Thumbnail removed')
@@ -302,36 +309,47 @@ def generate_random_name(length: int = 8) -> str:
     chars = string.ascii_letters + string.digits
     return ''.join(random.choice(chars) for _ in range(length))
 
-async def rename_file(file_path: str, user_id: int) -> str:
-    """Rename a file according to user settings."""
-    try:
-        # Get user settings
-        delete_words = await get_user_data_key(user_id, 'delete_words', [])
+async def build_renamed_filename(
+    file_name: str,
+    user_id: int,
+    settings: Optional[UserSettings] = None
+) -> str:
+    """Apply the user's rename settings to a bare file name."""
+    # Get user settings
+    if settings:
+        rename_tag = settings.rename_tag
+    else:
         rename_tag = await get_user_data_key(user_id, 'rename_tag', '')
-        replacements = await get_user_data_key(user_id, 'replacement_words', {})
-        
-        # Extract filename parts
-        base, ext = os.path.splitext(file_path)
-        ext = ext.lstrip('.').lower()
-        
-        # Determine proper extension
-        if not ext or ext not in VIDEO_EXTENSIONS:
-            ext = 'mp4' if any(v in base.lower() for v in VIDEO_EXTENSIONS) else 'bin'
+    rules = await get_text_rules(user_id, settings)
+    
+    # Extract filename parts
+    base, ext = os.path.splitext(file_name)
+    ext = ext.lstrip('.').lower()
+    
+    # Determine proper extension
+    if not ext or ext not in VIDEO_EXTENSIONS:
+        ext = 'mp4' if any(v in base.lower() for v in VIDEO_EXTENSIONS) else 'bin'
+    
+    # Process filename
+    filename = rules.process_filename(base)
         
-        # Process filename
-        filename = os.path.basename(base)
-        for word in delete_words:
-            filename = filename.replace(word, '')
-            
-        for old, new in replacements.items():
-            filename = filename.replace(old, new)
-            
-        # Construct new filename
-        new_filename = f"{filename} {rename_tag}".strip() + f".{ext}"
+    # Construct new filename
+    return f"{filename} {rename_tag}".strip() + f".{ext}"
+
+async def rename_file(
+    file_path: str,
+    user_id: int,
+    settings: Optional[UserSettings] = None
+) -> str:
+    """Rename a file according to user settings."""
+    try:
+        new_filename = await build_renamed_filename(
+            os.path.basename(file_path), user_id, settings
+        )
         new_path = os.path.join(os.path.dirname(file_path), new_filename)
         
         os.rename(file_path, new_path)
         return new_path
     except Exception as e:
         logger.error(f"File rename error: {e}")
-        return file_path
\ No newline at end of file
+        return file_path
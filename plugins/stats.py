@@ -8,9 +8,15 @@ from utils.func import (
     get_display_name,
     get_user_data,
     premium_users_collection,
-    is_premium_user
+    is_premium_user,
+    invalidate_premium_user,
+    utc_expiry,
+    get_active_job,
+    get_user_cache_stats,
+    get_media_cache_stats
 )
-from config import OWNER_ID
+from config import OWNER_ID, JOB_QUEUE
+from plugins.batch import SCHEDULER, UB, UC, StartupMetrics
 import logging
 
 # Configure logging
@@ -52,13 +58,15 @@ class PremiumManager:
                     'user_id': target_user_id,
                     'subscription_start': datetime.now(),
                     'subscription_end': expiry_date,
-                    'expireAt': expiry_date,
+                    'expireAt': utc_expiry(expiry_date),
                     'transferred_from': sender_id,
                     'transferred_from_name': sender_name
                 }},
                 upsert=True
             )
             await premium_users_collection.delete_one({'user_id': sender_id})
+            invalidate_premium_user(target_user_id)
+            invalidate_premium_user(sender_id)
 
             # Format expiry time for display
             expiry_ist = expiry_date + timedelta(hours=5, minutes=30)
@@ -124,6 +132,7 @@ class PremiumManager:
             result = await premium_users_collection.delete_one(
                 {'user_id': target_user_id}
             )
+            invalidate_premium_user(target_user_id)
 
             if result.deleted_count > 0:
                 await event.respond(
@@ -153,6 +162,32 @@ class StatusManager:
         ist_time = utc_time + timedelta(hours=5, minutes=30)
         return ist_time.strftime('%d-%b-%Y %I:%M:%S %p')
 
+    @staticmethod
+    def format_eta(seconds: float) -> str:
+        """Format an ETA in seconds as e.g. '1h 05m' or '3m 20s'."""
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f'{hours}h {minutes:02d}m' if hours else f'{minutes}m {seconds:02d}s'
+
+    @staticmethod
+    async def get_batch_status(user_id: int) -> str:
+        """Describe the user's batch: running, queued (with position) or none."""
+        job = SCHEDULER.find(user_id)
+        if not job:
+            # With the job queue the batch may be waiting in MongoDB or on a worker
+            queued = JOB_QUEUE and await get_active_job(user_id)
+            if not queued:
+                return '❌ No batch'
+            if queued['status'] == 'queued':
+                return '⏳ Queued, waiting for a worker'
+            progress = queued.get('progress', {})
+            return f"▶️ Running on a worker, {progress.get('current', 0)}/{queued['batch']['total']} done"
+        eta = StatusManager.format_eta(SCHEDULER.eta(job))
+        position = SCHEDULER.position(job)
+        if position == 0:
+            return f'▶️ Running, {job.remaining} left (ETA {eta})'
+        return f'⏳ Queued #{position} of {len(SCHEDULER.waiting)} (ETA {eta})'
+
     @staticmethod
     async def get_user_status(user_id: int) -> str:
         """Generate status message for a user."""
@@ -176,10 +211,52 @@ class StatusManager:
             "**Your current status:**\n\n"
             f"**Login Status:** {session_status}\n"
             f"**Bot Status:** {bot_status}\n"
-            f"**Premium:** {premium_status}"
+            f"**Premium:** {premium_status}\n"
+            f"**Batch:** {await StatusManager.get_batch_status(user_id)}"
+        )
+
+    @staticmethod
+    def format_hit_rate(stats: dict) -> str:
+        """Format hit/miss counters as e.g. '93.1% (512 hits, 38 misses)'."""
+        return f"{stats['hit_rate']:.1%} ({stats['hits']} hits, {stats['misses']} misses)"
+
+    @staticmethod
+    def get_cache_report() -> str:
+        """Cache and latency counters of this process, for the owner."""
+        lines = ["**Cache statistics (this process):**\n"]
+        for pool in (UB, UC):
+            stats = pool.stats()
+            lines.append(
+                f"**{pool.name} pool:** {stats['size']}/{stats['max_size']} clients, "
+                f"{stats['leased']} leased, {stats['evictions']} evicted, "
+                f"hit rate {StatusManager.format_hit_rate(stats)}"
+            )
+        users = get_user_cache_stats()
+        lines.append(
+            f"**User settings cache:** {users['size']} users, {users['evictions']} evicted, "
+            f"hit rate {StatusManager.format_hit_rate(users)}"
+        )
+        media = get_media_cache_stats()
+        lines.append(
+            f"**Media dedupe cache:** {media['evictions']} evicted, "
+            f"hit rate {StatusManager.format_hit_rate(media)}"
         )
+        for kind, startup in StartupMetrics.summary().items():
+            lines.append(
+                f"**{kind.capitalize()} client starts:** {startup['starts']}, "
+                f"avg {startup['avg_start_seconds']:.2f}s to start, "
+                f"{startup['avg_first_message_seconds']:.2f}s to first message"
+            )
+        return "\n".join(lines)
 
 # Command Handlers
+@bot_client.on(events.NewMessage(pattern='/stats'))
+async def stats_handler(event):
+    """Owner-only report of cache hit rates and timings"""
+    if not await is_private_chat(event) or event.sender_id not in OWNER_ID:
+        return
+    await event.respond(StatusManager.get_cache_report())
+
 @bot_client.on(events.NewMessage(pattern='/status'))
 async def status_handler(event):
     """Handle /status command to check user session and bot status"""
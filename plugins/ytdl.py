@@ -19,7 +19,9 @@ from telethon.tl.types import DocumentAttributeVideo
 from telethon.tl.functions.messages import EditMessageRequest
 
 from shared_client import client, app
-from utils.func import get_video_metadata, screenshot
+from utils.func import probe_media
+from utils.thumbnails import thumbnails
+from utils.storage import storage
 from devgagantools import fast_upload
 from config import YT_COOKIES, INSTA_COOKIES
 
@@ -64,6 +66,11 @@ class DownloadManager:
                 return ydl.extract_info(url, download=False)
         return await asyncio.get_event_loop().run_in_executor(thread_pool, sync_extract)
 
+    @staticmethod
+    def estimated_size(info_dict: Dict) -> int:
+        """Expected download size from yt-dlp's info (0 if unknown)."""
+        return int(info_dict.get('filesize') or info_dict.get('filesize_approx') or 0)
+
     @staticmethod
     async def download_video(ydl_opts: Dict, url: str) -> None:
         """Download video using yt-dlp."""
@@ -286,7 +293,8 @@ class MediaProcessor:
         user_id = event.sender_id
         start_time = time.time()
         random_filename = f"@team_spy_pro_{user_id}"
-        download_path = f"{random_filename}.mp3"
+        # Each job gets its own directory (leased once the size is known)
+        lease = None
 
         # Create temp cookie file if needed
         temp_cookie_path = None
@@ -297,7 +305,6 @@ class MediaProcessor:
 
         ydl_opts = {
             'format': 'bestaudio/best',
-            'outtmpl': f"{random_filename}.%(ext)s",
             'cookiefile': temp_cookie_path,
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
@@ -314,6 +321,10 @@ class MediaProcessor:
             # Extract info and download
             info_dict = await DownloadManager.extract_info(ydl_opts, url)
             title = info_dict.get('title', 'Extracted Audio')
+            # The source and the extracted mp3 sit on disk together
+            lease = await storage.acquire(2 * DownloadManager.estimated_size(info_dict))
+            download_path = lease.file(f"{random_filename}.mp3")
+            ydl_opts['outtmpl'] = lease.file(f"{random_filename}.%(ext)s")
             await DownloadManager.download_video(ydl_opts, url)
 
             if not os.path.exists(download_path):
@@ -345,8 +356,7 @@ class MediaProcessor:
             logger.exception("Audio processing error")
             await event.reply(f"**__An error occurred: {e}__**")
         finally:
-            if os.path.exists(download_path):
-                os.remove(download_path)
+            await storage.release(lease)
             if temp_cookie_path and os.path.exists(temp_cookie_path):
                 os.remove(temp_cookie_path)
             if progress_msg:
@@ -364,7 +374,8 @@ class MediaProcessor:
         user_id = event.sender_id
         start_time = time.time()
         random_filename = DownloadManager.get_random_string() + ".mp4"
-        download_path = os.path.abspath(random_filename)
+        lease = None
+        download_path = None
 
         # Create temp cookie file if needed
         temp_cookie_path = None
@@ -374,7 +385,6 @@ class MediaProcessor:
                 temp_cookie_path = f.name
 
         ydl_opts = {
-            'outtmpl': download_path,
             'format': 'best',
             'cookiefile': temp_cookie_path,
             'writethumbnail': True,
@@ -402,12 +412,20 @@ class MediaProcessor:
                     await progress_msg.edit("**❌ Video is larger than 2GB**")
                     return
 
-            # Download video
+            # Download video into a job directory sized for it
+            lease = await storage.acquire(DownloadManager.estimated_size(info_dict))
+            download_path = lease.file(random_filename)
+            ydl_opts['outtmpl'] = download_path
             await DownloadManager.download_video(ydl_opts, url)
             title = info_dict.get('title', 'Powered by Team SPY')
 
-            # Get metadata
-            video_meta = await get_video_metadata(download_path)
+            # Get metadata (and a midpoint thumbnail unless yt-dlp has one)
+            thumbnail_url = info_dict.get('thumbnail')
+            video_meta = await probe_media(
+                download_path,
+                int(info_dict.get('duration') or 0),
+                with_thumb=not thumbnail_url
+            )
             metadata.update({
                 'width': info_dict.get('width') or video_meta['width'],
                 'height': info_dict.get('height') or video_meta['height'],
@@ -415,13 +433,12 @@ class MediaProcessor:
             })
 
             # Handle thumbnail
-            thumbnail_url = info_dict.get('thumbnail')
             if thumbnail_url:
-                thumbnail_path = os.path.join(tempfile.gettempdir(), f"thumb_{random_filename}.jpg")
+                thumbnail_path = lease.file(f"thumb_{random_filename}.jpg")
                 await DownloadManager.download_thumbnail(thumbnail_url, thumbnail_path)
             
             if not thumbnail_path:
-                thumbnail_path = await screenshot(download_path, metadata['duration'], user_id)
+                thumbnail_path = await thumbnails.get(user_id) or video_meta['thumb']
 
             # Upload
             await progress_msg.delete()
@@ -462,12 +479,9 @@ class MediaProcessor:
             logger.exception("Video processing error")
             await event.reply(f"**__An error occurred: {e}__**")
         finally:
-            if os.path.exists(download_path):
-                os.remove(download_path)
+            await storage.release(lease)
             if temp_cookie_path and os.path.exists(temp_cookie_path):
                 os.remove(temp_cookie_path)
-            if thumbnail_path and os.path.exists(thumbnail_path):
-                os.remove(thumbnail_path)
             if progress_msg:
                 await progress_msg.delete()
 
@@ -1,5 +1,5 @@
 from telethon import TelegramClient
-from config import API_ID, API_HASH, BOT_TOKEN, STRING
+from config import API_ID, API_HASH, BOT_TOKEN, STRING, WORKER_MODE, MAX_CONCURRENT_TRANSMISSIONS
 from pyrogram import Client
 import sys
 import asyncio
@@ -7,11 +7,25 @@ from typing import Tuple, Optional
 
 # Initialize clients with type hints
 client: TelegramClient = TelegramClient("telethonbot", API_ID, API_HASH)
-app: Client = Client("pyrogrambot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
 userbot: Optional[Client] = None
 
+if WORKER_MODE:
+    # Workers only send; the front-end process keeps receiving the updates
+    app: Client = Client(
+        "pyrogrambot_worker", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN,
+        in_memory=True, no_updates=True, max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS
+    )
+else:
+    app: Client = Client(
+        "pyrogrambot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN,
+        max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS
+    )
+
 if STRING:
-    userbot = Client("4gbbot", api_id=API_ID, api_hash=API_HASH, session_string=STRING)
+    userbot = Client(
+        "4gbbot", api_id=API_ID, api_hash=API_HASH, session_string=STRING,
+        no_updates=WORKER_MODE, max_concurrent_transmissions=MAX_CONCURRENT_TRANSMISSIONS
+    )
 
 async def start_client() -> Tuple[TelegramClient, Client, Optional[Client]]:
     """
@@ -21,8 +35,8 @@ async def start_client() -> Tuple[TelegramClient, Client, Optional[Client]]:
         Tuple containing (telethon_client, pyrogram_bot_client, pyrogram_user_client)
     """
     try:
-        # Start Telethon client
-        if not client.is_connected():
+        # Start Telethon client (its handlers are not needed by workers)
+        if not WORKER_MODE and not client.is_connected():
             await client.start(bot_token=BOT_TOKEN)
             print("SpyLib Telethon client started successfully")
         
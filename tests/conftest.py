@@ -0,0 +1,10 @@
+import os
+import sys
+
+# config.py refuses to import without these; the tests never connect
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+os.environ.setdefault("BOT_TOKEN", "1:test")
+os.environ.setdefault("MONGO_DB", "mongodb://localhost:27017")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
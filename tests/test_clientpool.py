@@ -0,0 +1,29 @@
+import asyncio
+
+from utils.clientpool import ClientPool
+
+
+class FakeClient:
+    def __init__(self) -> None:
+        self.stopped = False
+
+    async def stop(self) -> None:
+        self.stopped = True
+
+
+def test_idle_clients_are_stopped_then_cleaned_up():
+    evicted = []
+
+    async def scenario():
+        pool = ClientPool("test", max_size=4, idle_timeout=-1, on_evict=evicted.append)
+        idle, leased = FakeClient(), FakeClient()
+        pool[1], pool[2] = idle, leased
+        pool.acquire(2)
+        pool.sweep()
+        await asyncio.gather(*pool._stopping)
+        return pool, idle, leased
+
+    pool, idle, leased = asyncio.run(scenario())
+    assert idle.stopped and not leased.stopped
+    assert evicted == [1]
+    assert 1 not in pool and 2 in pool
@@ -0,0 +1,134 @@
+import asyncio
+import copy
+import itertools
+
+import pytest
+
+pytest.importorskip("motor")
+
+from pymongo import ReturnDocument
+
+from utils import func
+from utils.func import JOB_MAX_ATTEMPTS, claim_job, complete_job, enqueue_job, heartbeat_job
+
+
+def matches(document, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, q) for q in condition):
+                return False
+            continue
+        value = document.get(key)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if op == "$lt" and not (value is not None and value < operand):
+                    return False
+                if op == "$gte" and not (value is not None and value >= operand):
+                    return False
+                if op == "$in" and value not in operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def apply(document, update):
+    document.update(update.get("$set", {}))
+    for key, step in update.get("$inc", {}).items():
+        document[key] = document.get(key, 0) + step
+
+
+class InsertResult:
+    def __init__(self, inserted_id):
+        self.inserted_id = inserted_id
+
+
+class JobsCollection:
+    """Just enough of a Motor collection for the job queue queries."""
+
+    def __init__(self):
+        self.documents = []
+        self.ids = itertools.count(1)
+
+    async def insert_one(self, document):
+        document = {"_id": next(self.ids), **document}
+        self.documents.append(document)
+        return InsertResult(document["_id"])
+
+    async def update_many(self, query, update):
+        for document in self.documents:
+            if matches(document, query):
+                apply(document, update)
+
+    async def update_one(self, query, update):
+        for document in self.documents:
+            if matches(document, query):
+                apply(document, update)
+                return
+
+    async def find_one_and_update(self, query, update, sort=None, return_document=None):
+        candidates = [d for d in self.documents if matches(d, query)]
+        for key, direction in reversed(sort or []):
+            candidates.sort(key=lambda d: d[key], reverse=direction < 0)
+        if not candidates:
+            return None
+        apply(candidates[0], update)
+        assert return_document is ReturnDocument.AFTER
+        return copy.deepcopy(candidates[0])
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    collection = JobsCollection()
+    monkeypatch.setattr(func, "jobs_collection", collection)
+    return collection
+
+
+def test_a_leased_job_is_not_claimed_twice(jobs):
+    async def scenario():
+        await enqueue_job(1, {"total": 3})
+        job = await claim_job("worker-a", 60)
+        assert job["lease_owner"] == "worker-a" and job["attempts"] == 1
+        assert await claim_job("worker-b", 60) is None
+        assert await heartbeat_job(job["_id"], "worker-a", 60, {"current": 2, "success": 2})
+        assert jobs.documents[0]["progress"] == {"current": 2, "success": 2}
+
+    asyncio.run(scenario())
+
+
+def test_an_expired_lease_moves_the_job_to_another_worker(jobs):
+    async def scenario():
+        await enqueue_job(1, {"total": 3})
+        # A negative lease has already expired: worker-a stopped heartbeating
+        job = await claim_job("worker-a", -1)
+        reclaimed = await claim_job("worker-b", 60)
+        assert reclaimed["_id"] == job["_id"]
+        assert reclaimed["lease_owner"] == "worker-b" and reclaimed["attempts"] == 2
+
+        # The old worker's heartbeat reports the lease as lost...
+        assert await heartbeat_job(job["_id"], "worker-a", 60) is None
+        # ...and its completion does not overwrite the new owner's job
+        await complete_job(job["_id"], "worker-a", "failed")
+        assert jobs.documents[0]["status"] == "running"
+
+    asyncio.run(scenario())
+
+
+def test_a_job_that_keeps_losing_its_lease_is_failed(jobs):
+    async def scenario():
+        await enqueue_job(1, {"total": 3})
+        for attempt in range(JOB_MAX_ATTEMPTS):
+            assert (await claim_job(f"worker-{attempt}", -1))["attempts"] == attempt + 1
+        assert await claim_job("worker-last", 60) is None
+        assert jobs.documents[0]["status"] == "failed"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_jobs_are_not_claimed(jobs):
+    async def scenario():
+        await enqueue_job(1, {"total": 3})
+        jobs.documents[0]["cancel_requested"] = True
+        assert await claim_job("worker-a", 60) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("motor")
+
+from utils.func import parse_batch_links
+
+
+def test_forum_topic_links_use_the_message_id():
+    units = parse_batch_links("https://t.me/c/123/7/456-460 t.me/chan/9/10")
+    assert units == [
+        {'chat_id': '-100123', 'link_type': 'private', 'message_id': 456, 'count': 5},
+        {'chat_id': 'chan', 'link_type': 'public', 'message_id': 10, 'count': 1},
+    ]
+
+
+def test_plain_links_still_parse():
+    assert parse_batch_links("t.me/c/123/456") == [
+        {'chat_id': '-100123', 'link_type': 'private', 'message_id': 456, 'count': 1}
+    ]
+
+
+def test_trailing_slash_is_accepted():
+    assert parse_batch_links("t.me/chan/100/ https://t.me/c/123/7/456/") == [
+        {'chat_id': 'chan', 'link_type': 'public', 'message_id': 100, 'count': 1},
+        {'chat_id': '-100123', 'link_type': 'private', 'message_id': 456, 'count': 1},
+    ]
@@ -0,0 +1,39 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("motor")
+
+from utils import func
+
+
+class PremiumCollection:
+    def __init__(self, document):
+        self.document = document
+        self.reads = 0
+
+    async def find_one(self, query):
+        self.reads += 1
+        return self.document
+
+
+def test_removal_elsewhere_is_seen_after_the_positive_ttl(monkeypatch):
+    collection = PremiumCollection(
+        {"user_id": 9, "subscription_end": datetime.now() + timedelta(days=1)}
+    )
+    monkeypatch.setattr(func, "premium_users_collection", collection)
+    func.invalidate_premium_user(9)
+
+    async def scenario():
+        assert await func.is_premium_user(9)
+        assert await func.is_premium_user(9)
+        assert collection.reads == 1
+
+        # Another process removes the subscription
+        collection.document = None
+        monkeypatch.setattr(func, "PREMIUM_POSITIVE_TTL", -1)
+        assert not await func.is_premium_user(9)
+        assert collection.reads == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+from pyrogram.errors import FloodWait
+
+from utils import ratelimit
+from utils.ratelimit import AdaptiveRateLimiter, call_limited, get_limiter
+
+
+class Client:
+    pass
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Fake clock: asyncio.sleep in the limiter advances time.monotonic instantly."""
+    clock = [100.0]
+    slept = []
+
+    async def sleep(seconds):
+        slept.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(ratelimit.asyncio, "sleep", sleep)
+    return slept
+
+
+def test_burst_is_free_then_calls_are_paced(sleeps):
+    async def scenario():
+        limiter = AdaptiveRateLimiter(rate=2, burst=3)
+        for _ in range(3):
+            await limiter.acquire()
+        assert sleeps == []
+        await limiter.acquire()
+        assert sleeps == [pytest.approx(0.5)]
+
+    asyncio.run(scenario())
+
+
+def test_flood_wait_blocks_halves_the_rate_and_recovers(sleeps):
+    limiter = AdaptiveRateLimiter(rate=1, burst=5)
+    limiter.on_flood_wait(30)
+    assert limiter.rate == 0.5
+    assert limiter.tokens == 0
+    assert limiter.blocked_until == 130.0
+
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(0.5 + AdaptiveRateLimiter.RECOVERY_STEP)
+    for _ in range(100):
+        limiter.on_success()
+    assert limiter.rate == 1
+
+
+def test_call_limited_waits_out_a_flood_wait_and_retries(sleeps):
+    calls = []
+
+    async def send():
+        calls.append(1)
+        if len(calls) == 1:
+            raise FloodWait(value=7)
+        return "sent"
+
+    client = Client()
+    assert asyncio.run(call_limited(client, send)) == "sent"
+    assert len(calls) == 2
+    assert get_limiter(client).flood_waits == 1
+    assert sleeps[0] == pytest.approx(7)
+
+
+def test_flood_wait_is_raised_once_retries_run_out(sleeps, monkeypatch):
+    monkeypatch.setattr(ratelimit, "FLOOD_WAIT_RETRIES", 1)
+
+    async def send():
+        raise FloodWait(value=1)
+
+    with pytest.raises(FloodWait):
+        asyncio.run(call_limited(Client(), send))
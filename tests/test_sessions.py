@@ -0,0 +1,72 @@
+import os
+import asyncio
+
+import pytest
+
+pytest.importorskip("pyrogram")
+from pyrogram.storage import FileStorage, MemoryStorage
+from pathlib import Path
+
+from utils import sessions
+
+
+async def make_session_string() -> str:
+    memory = MemoryStorage("source")
+    await memory.open()
+    await memory.dc_id(2)
+    await memory.api_id(12345)
+    await memory.test_mode(False)
+    await memory.auth_key(os.urandom(256))
+    await memory.user_id(424242)
+    await memory.is_bot(False)
+    await memory.date(0)
+    session_string = await memory.export_session_string()
+    await memory.close()
+    return session_string
+
+
+def test_seed_session_file_writes_real_file_storage(tmp_path, monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_WORKDIR", str(tmp_path))
+    monkeypatch.setattr(sessions, "LEGACY_SESSION_WORKDIR", str(tmp_path / "legacy"))
+
+    async def scenario():
+        session_string = await make_session_string()
+        warm = await sessions.seed_session_file("user_1", session_string)
+        assert warm is False
+        assert (tmp_path / "user_1.session").exists()
+
+        storage = FileStorage("user_1", Path(tmp_path))
+        await storage.open()
+        try:
+            assert await storage.user_id() == 424242
+            assert await storage.dc_id() == 2
+            assert await storage.export_session_string() == session_string
+        finally:
+            await storage.close()
+
+        # Same session again: the file is reused (warm start)
+        assert await sessions.seed_session_file("user_1", session_string) is True
+
+    asyncio.run(scenario())
+
+
+def test_session_files_are_private_and_dropped(tmp_path, monkeypatch):
+    workdir = tmp_path / "sessions"
+    legacy = tmp_path / "legacy"
+    legacy.mkdir()
+    (legacy / "user_2.session").write_bytes(b"old plaintext copy")
+    monkeypatch.setattr(sessions, "SESSION_WORKDIR", str(workdir))
+    monkeypatch.setattr(sessions, "LEGACY_SESSION_WORKDIR", str(legacy))
+
+    async def scenario():
+        await sessions.seed_session_file("user_2", await make_session_string())
+
+    asyncio.run(scenario())
+    assert workdir.stat().st_mode & 0o777 == 0o700
+    assert (workdir / "user_2.session").stat().st_mode & 0o777 == 0o600
+    assert (workdir / "user_2.fingerprint").stat().st_mode & 0o777 == 0o600
+    assert not (legacy / "user_2.session").exists()
+
+    sessions.drop_session_file("user_2")
+    assert not (workdir / "user_2.session").exists()
+    assert not (workdir / "user_2.fingerprint").exists()
@@ -0,0 +1,43 @@
+import asyncio
+import shutil
+from collections import namedtuple
+
+from utils.storage import StorageManager
+
+MB = 1024 * 1024
+Usage = namedtuple("Usage", "total used free")
+
+
+def test_tmpfs_admission_checks_real_free_space(tmp_path, monkeypatch):
+    shm = tmp_path / "shm"
+    shm.mkdir()
+    manager = StorageManager(
+        root=str(tmp_path / "disk"),
+        budget=10 * 1024 * MB,
+        tmpfs_root=str(shm),
+        tmpfs_budget=512 * MB,
+        tmpfs_max_file=512 * MB
+    )
+    real_usage = shutil.disk_usage
+
+    def disk_usage(path):
+        # Docker's default 64MB /dev/shm
+        if str(path).startswith(str(shm)):
+            return Usage(64 * MB, 0, 64 * MB)
+        return real_usage(path)
+
+    monkeypatch.setattr(shutil, "disk_usage", disk_usage)
+
+    async def scenario():
+        big = await manager.acquire(100 * MB)
+        small = await manager.acquire(8 * MB)
+        assert not big.tmpfs
+        assert small.tmpfs
+        moved = await manager.move_to_disk(small)
+        assert not moved.tmpfs and moved.reserved == 8 * MB
+        assert manager.tmpfs_reserved == 0
+        await manager.release(big)
+        await manager.release(moved)
+        assert manager.reserved == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("motor")
+
+from utils import func
+from utils.func import UserSettings, get_text_rules, invalidate_text_rules
+
+
+def settings(replacements):
+    return UserSettings(user_id=5, version=0, replacement_words=replacements)
+
+
+def test_rules_are_compiled_once_until_invalidated():
+    async def scenario():
+        first = await get_text_rules(5, settings({"a": "b"}))
+        assert await get_text_rules(5, settings({"a": "b"})) is first
+
+        invalidate_text_rules(5)
+        second = await get_text_rules(5, settings({"a": "c"}))
+        assert second is not first
+        assert second.process_text("a x") == "c x"
+
+    asyncio.run(scenario())
+
+
+def test_rules_expire_after_the_refresh_window(monkeypatch):
+    async def scenario():
+        first = await get_text_rules(6, UserSettings(user_id=6, version=0))
+        monkeypatch.setattr(func, "SETTINGS_REFRESH_SECONDS", -1)
+        assert await get_text_rules(6, UserSettings(user_id=6, version=0)) is not first
+
+    asyncio.run(scenario())
@@ -0,0 +1,23 @@
+import asyncio
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from utils.thumbnails import THUMB_MAX_SIDE, ThumbnailService
+
+
+def test_small_but_oversized_legacy_thumbnail_is_rescaled(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    output = io.BytesIO()
+    Image.new("RGB", (1280, 720)).save(output, "JPEG")
+    assert output.tell() < 200 * 1024  # under the byte limit, over the side limit
+    (tmp_path / "7.jpg").write_bytes(output.getvalue())
+
+    thumb = asyncio.run(ThumbnailService().get(7))
+
+    with Image.open(thumb) as image:
+        assert max(image.size) == THUMB_MAX_SIDE
+    with Image.open(tmp_path / "7.jpg") as image:
+        assert max(image.size) == THUMB_MAX_SIDE
@@ -0,0 +1,163 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+import pytest
+
+pytest.importorskip("pyrogram")
+
+from pyrogram import raw
+
+from utils import transfer
+from utils.ratelimit import get_limiter
+from utils.transfer import (
+    DOWNLOAD_CHUNK,
+    PART_SIZE,
+    parallel_download,
+    split_segments,
+    upload_file_parallel,
+    upload_stream
+)
+
+
+class StreamingClient:
+    """stream_media over an in-memory file; the first `short_streams` streams end after one chunk."""
+
+    def __init__(self, data: bytes, short_streams: int = 0) -> None:
+        self.data = data
+        self.short_streams = short_streams
+        self.calls = []
+
+    async def stream_media(self, message, offset=0, limit=0):
+        self.calls.append((offset, limit))
+        short = len(self.calls) <= self.short_streams
+        for index in range(offset, offset + limit):
+            yield self.data[index * DOWNLOAD_CHUNK:(index + 1) * DOWNLOAD_CHUNK]
+            if short:
+                return
+
+
+def test_split_segments_covers_every_chunk_once():
+    assert split_segments(10, 4) == [(0, 3), (3, 3), (6, 2), (8, 2)]
+    assert split_segments(2, 4) == [(0, 1), (1, 1)]
+    assert split_segments(0, 4) == []
+
+
+def test_parallel_download_opens_one_stream_per_worker(tmp_path):
+    data = bytes(range(256)) * (DOWNLOAD_CHUNK * 9 // 256) + b"tail"
+    client = StreamingClient(data)
+    path = str(tmp_path / "file.bin")
+
+    asyncio.run(parallel_download(client, None, path, len(data), workers=4))
+
+    assert sorted(client.calls) == [(0, 3), (3, 3), (6, 2), (8, 2)]
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+
+def test_parallel_download_resumes_a_short_segment(tmp_path):
+    data = b"x" * (DOWNLOAD_CHUNK * 8)
+    client = StreamingClient(data, short_streams=2)
+    path = str(tmp_path / "file.bin")
+
+    asyncio.run(parallel_download(client, None, path, len(data), workers=2))
+
+    # Each 4-chunk range stopped after one chunk and resumed from the next
+    assert sorted(client.calls) == [(0, 4), (1, 3), (4, 4), (5, 3)]
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+
+class UploadingClient:
+    def rnd_id(self) -> int:
+        return 42
+
+
+class RecordingSession:
+    def __init__(self) -> None:
+        self.requests = []
+
+    async def invoke(self, request):
+        self.requests.append(request)
+        return True
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    opened = []
+
+    @asynccontextmanager
+    async def media_sessions(client, count=1):
+        opened.extend(RecordingSession() for _ in range(count))
+        for session in opened:
+            get_limiter(session, 1000, 100)
+        yield opened
+
+    monkeypatch.setattr(transfer, "media_sessions", media_sessions)
+    return opened
+
+
+def upload(path, workers=8):
+    return asyncio.run(upload_file_parallel(UploadingClient(), str(path), workers))
+
+
+def test_upload_file_parallel_sends_every_big_part_once(tmp_path, sessions):
+    path = tmp_path / "big.bin"
+    path.write_bytes(b"b" * (11 * 1024 * 1024 + 1))
+
+    uploaded = upload(path)
+
+    # 8 workers over two media sessions, 4 workers each
+    assert len(sessions) == 2
+    requests = [r for session in sessions for r in session.requests]
+    assert all(isinstance(r, raw.functions.upload.SaveBigFilePart) for r in requests)
+    assert sorted(r.file_part for r in requests) == list(range(23))
+    assert {r.file_total_parts for r in requests} == {23}
+    assert sum(len(r.bytes) for r in requests) == os.path.getsize(path)
+    assert isinstance(uploaded, raw.types.InputFileBig) and uploaded.parts == 23
+
+
+def test_upload_file_parallel_uses_small_parts_below_10mb(tmp_path, sessions):
+    path = tmp_path / "small.bin"
+    path.write_bytes(b"s" * (PART_SIZE + 1))
+
+    uploaded = upload(path, workers=1)
+
+    requests = sessions[0].requests
+    assert [type(r) for r in requests] == [raw.functions.upload.SaveFilePart] * 2
+    assert isinstance(uploaded, raw.types.InputFile) and uploaded.parts == 2
+
+
+def test_upload_file_parallel_checks_the_file_size(tmp_path, sessions, monkeypatch):
+    empty = tmp_path / "empty.bin"
+    empty.write_bytes(b"")
+    with pytest.raises(ValueError):
+        upload(empty)
+
+    shrunk = tmp_path / "shrunk.bin"
+    shrunk.write_bytes(b"x" * PART_SIZE)
+    monkeypatch.setattr(transfer.os.path, "getsize", lambda path: 2 * PART_SIZE)
+    with pytest.raises(ValueError):
+        upload(shrunk, workers=1)
+
+
+async def chunks_of(data: bytes, size: int = 300 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_upload_stream_rechunks_onto_a_media_session(sessions):
+    data = b"r" * (2 * PART_SIZE + 10)
+
+    uploaded = asyncio.run(upload_stream(UploadingClient(), chunks_of(data), len(data), "r.bin"))
+
+    assert len(sessions) == 1
+    assert [len(r.bytes) for r in sessions[0].requests] == [PART_SIZE, PART_SIZE, 10]
+    assert uploaded.parts == 3 and uploaded.name == "r.bin"
+
+
+@pytest.mark.parametrize("declared", [PART_SIZE, 3 * PART_SIZE])
+def test_upload_stream_rejects_a_size_mismatch(sessions, declared):
+    data = b"m" * (2 * PART_SIZE)
+    with pytest.raises(ValueError):
+        asyncio.run(upload_stream(UploadingClient(), chunks_of(data), declared, "m.bin"))
@@ -0,0 +1,162 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, Optional, Set
+from config import CLIENT_POOL_SIZE, CLIENT_IDLE_TIMEOUT
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class ClientPool:
+    """
+    Bounded LRU pool of started pyrogram clients keyed by user ID.
+    Supports the dict operations the plugins already use (`in`, `[]`,
+    `get`, `pop`, `del`). Clients that are leased by a running task are
+    never evicted; idle ones are stopped when the pool overflows or they
+    have not been used for `idle_timeout` seconds. `on_evict(user_id)` runs
+    once an evicted client has stopped.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_size: int = CLIENT_POOL_SIZE,
+        idle_timeout: float = CLIENT_IDLE_TIMEOUT,
+        on_evict: Optional[Callable[[int], None]] = None
+    ) -> None:
+        self.name = name
+        self.on_evict = on_evict
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._clients: "OrderedDict[int, Any]" = OrderedDict()
+        self._last_used: Dict[int, float] = {}
+        self._refs: Dict[int, int] = {}
+        self._stopping: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._clients
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(list(self._clients))
+
+    def __getitem__(self, user_id: int) -> Any:
+        client = self._clients[user_id]
+        self._touch(user_id)
+        return client
+
+    def __setitem__(self, user_id: int, client: Any) -> None:
+        self._clients[user_id] = client
+        self._touch(user_id)
+        self._evict_overflow()
+
+    def __delitem__(self, user_id: int) -> None:
+        del self._clients[user_id]
+        self._last_used.pop(user_id, None)
+
+    def get(self, user_id: int, default: Any = None) -> Any:
+        if user_id not in self._clients:
+            return default
+        return self[user_id]
+
+    def pop(self, user_id: int, default: Any = None) -> Any:
+        """Remove a client without stopping it (the caller owns it)."""
+        self._last_used.pop(user_id, None)
+        return self._clients.pop(user_id, default)
+
+    def lookup(self, user_id: int) -> Optional[Any]:
+        """Get a pooled client, counting the lookup as a hit or miss."""
+        client = self.get(user_id)
+        if client is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return client
+
+    def acquire(self, user_id: int) -> None:
+        """Pin a user's client so it is not evicted while in use."""
+        self._refs[user_id] = self._refs.get(user_id, 0) + 1
+        if user_id in self._clients:
+            self._touch(user_id)
+
+    def release(self, user_id: int) -> None:
+        """Unpin a client pinned with acquire()."""
+        refs = self._refs.get(user_id, 0) - 1
+        if refs > 0:
+            self._refs[user_id] = refs
+        else:
+            self._refs.pop(user_id, None)
+        if user_id in self._clients:
+            self._touch(user_id)
+
+    def _touch(self, user_id: int) -> None:
+        self._clients.move_to_end(user_id)
+        self._last_used[user_id] = time.monotonic()
+
+    def _evictable(self, user_id: int) -> bool:
+        return self._refs.get(user_id, 0) == 0
+
+    def _evict(self, user_id: int, reason: str) -> None:
+        client = self.pop(user_id)
+        if client is None:
+            return
+        self.evictions += 1
+        logger.info(f"Evicting {self.name} client of user {user_id} ({reason})")
+        task = asyncio.create_task(self._stop(user_id, client))
+        self._stopping.add(task)
+        task.add_done_callback(self._stopping.discard)
+
+    async def _stop(self, user_id: int, client: Any) -> None:
+        try:
+            await client.stop()
+        except Exception as e:
+            logger.error(f"Error stopping evicted {self.name} client: {e}")
+        if self.on_evict:
+            try:
+                self.on_evict(user_id)
+            except Exception as e:
+                logger.error(f"Error cleaning up evicted {self.name} client: {e}")
+
+    def _evict_overflow(self) -> None:
+        """Evict least recently used idle clients above max_size."""
+        overflow = len(self._clients) - self.max_size
+        if overflow <= 0:
+            return
+        for user_id in [uid for uid in self._clients if self._evictable(uid)][:overflow]:
+            self._evict(user_id, "pool full")
+
+    def sweep(self) -> None:
+        """Evict clients that have been idle longer than idle_timeout."""
+        deadline = time.monotonic() - self.idle_timeout
+        for user_id in list(self._clients):
+            if self._last_used.get(user_id, 0) < deadline and self._evictable(user_id):
+                self._evict(user_id, "idle")
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size and hit/miss/eviction counters."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._clients),
+            'max_size': self.max_size,
+            'leased': len(self._refs),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
+
+async def run_pool_sweeper(*pools: ClientPool, interval: float = 60) -> None:
+    """Periodically stop idle clients in the given pools."""
+    while True:
+        await asyncio.sleep(interval)
+        for pool in pools:
+            try:
+                pool.sweep()
+            except Exception as e:
+                logger.error(f"Error sweeping {pool.name} pool: {e}")
@@ -2,13 +2,25 @@ import concurrent.futures
 import time
 import os
 import re
-import cv2
 import logging
 import asyncio
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, Tuple, Union
+import hashlib
+import json
+import copy
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, Tuple, Union, List, FrozenSet, Pattern
 from motor.motor_asyncio import AsyncIOMotorClient
-from config import MONGO_DB as MONGO_URI, DB_NAME
+from pymongo import ReturnDocument, ASCENDING
+from pymongo.errors import OperationFailure
+from config import (
+    MONGO_DB as MONGO_URI,
+    DB_NAME,
+    PROBE_CONCURRENCY,
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL
+)
 
 # Configure logging
 logging.basicConfig(
@@ -20,9 +32,25 @@ logger = logging.getLogger(__name__)
 # Constants
 PUBLIC_LINK_PATTERN = re.compile(r'(https?://)?(t\.me|telegram\.me)/([^/]+)(/(\d+))?')
 PRIVATE_LINK_PATTERN = re.compile(r'(https?://)?(t\.me|telegram\.me)/c/(\d+)(/(\d+))?')
+# A link with an optional ID range: t.me/c/123/100-450 or t.me/name/100
+BATCH_LINK_PATTERN = re.compile(
+    # chat, optional forum topic ID (ignored: message IDs are chat-wide),
+    # message or range, optional trailing slash
+    r'(?:https?://)?(?:t\.me|telegram\.me)/(?:c/(\d+)|(?!c/)(\w+))/(?:\d+/)?(\d+)(?:[ \t]*-[ \t]*(\d+))?/?(?![\d/])'
+)
 VIDEO_EXTENSIONS = {"mp4", "mkv", "avi", "mov", "wmv", "flv", "webm", "mpeg", "mpg", "3gp"}
 DEFAULT_VIDEO_METADATA = {'width': 1, 'height': 1, 'duration': 1}
 
+# ffmpeg probe: banner parsing, concurrency bound and result cache
+PROBE_DURATION_PATTERN = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+PROBE_VIDEO_PATTERN = re.compile(r'Stream #\S+.*?: Video: (\w+).*?, (\d{2,5})x(\d{2,5})')
+PROBE_AUDIO_PATTERN = re.compile(r'Stream #\S+.*?: Audio: (\w+)')
+PROBE_ROTATION_PATTERN = re.compile(r'(?:rotate\s*:\s*|rotation of )(-?\d+(?:\.\d+)?)')
+PROBE_TIMEOUT = 120  # seconds
+PROBE_CACHE_SIZE = 256
+PROBE_SEMAPHORE = asyncio.Semaphore(PROBE_CONCURRENCY)
+PROBE_CACHE: "OrderedDict[Tuple[str, int, int], Dict[str, Any]]" = OrderedDict()
+
 # Database setup
 mongo_client = AsyncIOMotorClient(MONGO_URI)
 db = mongo_client[DB_NAME]
@@ -30,6 +58,53 @@ users_collection = db["users"]
 premium_users_collection = db["premium_users"]
 statistics_collection = db["statistics"]
 codedb = db["redeem_code"]
+media_cache_collection = db["media_cache"]
+jobs_collection = db["jobs"]
+
+# Indexes ensured at startup: (collection, keys, options)
+INDEXES = [
+    (users_collection, [("user_id", ASCENDING)], {"unique": True}),
+    (premium_users_collection, [("user_id", ASCENDING)], {"unique": True}),
+    # Mongo deletes a subscription once its expireAt passes; TTL indexes
+    # compare in UTC, so expireAt is always written with utc_expiry()
+    (premium_users_collection, [("expireAt", ASCENDING)], {"expireAfterSeconds": 0}),
+    (codedb, [("code", ASCENDING)], {"unique": True, "sparse": True}),
+    (codedb, [("expireAt", ASCENDING)], {"expireAfterSeconds": 0}),
+    (media_cache_collection, [("key", ASCENDING)], {"unique": True}),
+    (jobs_collection, [("status", ASCENDING), ("created_at", ASCENDING)], {}),
+    (jobs_collection, [("user_id", ASCENDING), ("status", ASCENDING)], {}),
+]
+
+# Batch job queue: a crashed worker's job is reclaimed once its lease expires
+JOB_MAX_ATTEMPTS = 3
+
+# Per-user settings version, bumped on every settings write in this process;
+# snapshots older than SETTINGS_REFRESH_SECONDS are re-read to see other processes' edits
+SETTINGS_VERSIONS: Dict[int, int] = {}
+SETTINGS_REFRESH_SECONDS = 60
+
+# Read-through cache of user documents: user_id -> (document or None, expiry)
+USER_CACHE: "OrderedDict[int, Tuple[Optional[Dict], float]]" = OrderedDict()
+USER_CACHE_STATS = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+# Premium status per user: user_id -> (active subscription or None, checked at).
+# Subscriptions are rechecked after PREMIUM_POSITIVE_TTL (sooner if they end)
+# and "not premium" after PREMIUM_NEGATIVE_TTL, so grants and removals made
+# by other processes show up.
+PREMIUM_CACHE: "OrderedDict[int, Tuple[Optional[Dict], float]]" = OrderedDict()
+PREMIUM_CACHE_SIZE = 10000
+PREMIUM_POSITIVE_TTL = 60  # seconds
+PREMIUM_NEGATIVE_TTL = 300  # seconds
+
+# Compiled replace/delete rules per user: user_id -> (rules, compiled at).
+# Dropped when those keys are saved here; recompiled after
+# SETTINGS_REFRESH_SECONDS so other processes' edits show up.
+TEXT_RULE_KEYS = frozenset({'replacement_words', 'delete_words'})
+TEXT_RULES_CACHE_SIZE = 1024
+TEXT_RULES_CACHE: "OrderedDict[int, Tuple[TextRules, float]]" = OrderedDict()
+
+# Process-local counters for the media dedupe cache
+MEDIA_CACHE_STATS = {'hits': 0, 'misses': 0, 'evictions': 0}
 
 # Session encoder constants (kept as-is for compatibility)
 a1 = "c2F2ZV9yZXN0cmljdGVkX2NvbnRlbnRfYm90cw=="
@@ -41,11 +116,6 @@ def is_private_link(link: str) -> bool:
     """Check if a Telegram link is for a private channel."""
     return bool(PRIVATE_LINK_PATTERN.match(link))
 
-def thumbnail(sender: str) -> Optional[str]:
-    """Get thumbnail path if exists."""
-    thumb_path = f'{sender}.jpg'
-    return thumb_path if os.path.exists(thumb_path) else None
-
 def hhmmss(seconds: int) -> str:
     """Convert seconds to HH:MM:SS format."""
     return time.strftime('%H:%M:%S', time.gmtime(seconds))
@@ -67,6 +137,44 @@ def parse_telegram_link(link: str) -> Tuple[Optional[str], Optional[int], Option
 # Alias for backward compatibility
 E = parse_telegram_link
 
+def parse_batch_links(text: str) -> List[Dict[str, Any]]:
+    """
+    Parse all links and ranges in a message into batch units.
+    Each unit is a contiguous range of one chat:
+    {chat_id, link_type, message_id (first ID), count}.
+    Overlapping and adjacent ranges of a chat are merged and duplicates
+    dropped; chats keep the order they were first mentioned in.
+    """
+    spans: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+    for match in BATCH_LINK_PATTERN.finditer(text):
+        private_id, username, first, last = match.groups()
+        first, last = int(first), int(last or first)
+        if first > last:
+            first, last = last, first
+        if first < 1:
+            continue
+        key = (f'-100{private_id}', 'private') if private_id else (username, 'public')
+        spans.setdefault(key, []).append((first, last))
+    
+    units = []
+    for (chat_id, link_type), ranges in spans.items():
+        merged: List[List[int]] = []
+        for first, last in sorted(ranges):
+            if merged and first <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], last)
+            else:
+                merged.append([first, last])
+        units.extend(
+            {
+                'chat_id': chat_id,
+                'link_type': link_type,
+                'message_id': first,
+                'count': last - first + 1
+            }
+            for first, last in merged
+        )
+    return units
+
 def get_display_name(user) -> str:
     """Get user's display name from Telegram user object."""
     name_parts = []
@@ -102,105 +210,325 @@ async def save_user_data(
 ) -> bool:
     """Save user data to MongoDB with error handling."""
     try:
+        now = datetime.now()
         await collection.update_one(
             {"user_id": user_id},
-            {"$set": {key: value, "updated_at": datetime.now()}},
+            {"$set": {key: value, "updated_at": now}},
             upsert=True
         )
+        if collection is users_collection:
+            _write_through(user_id, {key: value, "updated_at": now})
+        bump_settings_version(user_id)
+        if key in TEXT_RULE_KEYS:
+            invalidate_text_rules(user_id)
         return True
     except Exception as e:
         logger.error(f"Error saving data for user {user_id}: {e}", exc_info=True)
         return False
 
+async def unset_user_data(user_id: int, *keys: str) -> Optional[int]:
+    """
+    Remove keys from a user's document.
+    Returns the number of modified documents, or None on error.
+    """
+    try:
+        result = await users_collection.update_one(
+            {"user_id": user_id},
+            {"$unset": {key: "" for key in keys}}
+        )
+        _write_through(user_id, {}, removed=keys)
+        bump_settings_version(user_id)
+        if TEXT_RULE_KEYS.intersection(keys):
+            invalidate_text_rules(user_id)
+        return result.modified_count
+    except Exception as e:
+        logger.error(f"Error removing data for user {user_id}: {e}", exc_info=True)
+        return None
+
+def _write_through(user_id: int, values: Dict[str, Any], removed=()) -> None:
+    """Apply a write to the cached document (if any) instead of dropping it."""
+    entry = USER_CACHE.get(user_id)
+    if entry is None:
+        return
+    document = entry[0]
+    if document is None:
+        # Upserted a new document; we don't know its other fields
+        USER_CACHE.pop(user_id, None)
+        return
+    document.update(copy.deepcopy(values))
+    for key in removed:
+        document.pop(key, None)
+
+def invalidate_user_data(user_id: int) -> None:
+    """Drop a user's cached document (after writing it some other way)."""
+    USER_CACHE.pop(user_id, None)
+
+def get_user_cache_stats() -> Dict[str, Union[int, float]]:
+    """Hit/miss/eviction counters of the user document cache."""
+    lookups = USER_CACHE_STATS['hits'] + USER_CACHE_STATS['misses']
+    return {
+        **USER_CACHE_STATS,
+        'size': len(USER_CACHE),
+        'hit_rate': USER_CACHE_STATS['hits'] / lookups if lookups else 0.0
+    }
+
 async def get_user_data(
     user_id: int, 
     collection: AsyncIOMotorClient = users_collection
 ) -> Optional[Dict]:
-    """Retrieve all data for a user."""
+    """
+    Retrieve all data for a user.
+    Documents of users_collection are served from an LRU cache for up to
+    USER_CACHE_TTL seconds; callers get a copy they may modify.
+    """
+    cached = collection is users_collection
+    if cached:
+        entry = USER_CACHE.get(user_id)
+        if entry and entry[1] > time.monotonic():
+            USER_CACHE.move_to_end(user_id)
+            USER_CACHE_STATS['hits'] += 1
+            return copy.deepcopy(entry[0])
+        USER_CACHE_STATS['misses'] += 1
     try:
-        return await collection.find_one({"user_id": user_id})
+        document = await collection.find_one({"user_id": user_id})
     except Exception as e:
         logger.error(f"Error getting data for user {user_id}: {e}")
         return None
+    if cached:
+        USER_CACHE[user_id] = (document, time.monotonic() + USER_CACHE_TTL)
+        USER_CACHE.move_to_end(user_id)
+        while len(USER_CACHE) > USER_CACHE_SIZE:
+            USER_CACHE.popitem(last=False)
+            USER_CACHE_STATS['evictions'] += 1
+        document = copy.deepcopy(document)
+    return document
+
+async def get_user_data_key(
+    user_id: int,
+    key: str,
+    default: Any = None,
+    collection: AsyncIOMotorClient = users_collection
+) -> Any:
+    """Retrieve a single setting for a user."""
+    user_data = await get_user_data(user_id, collection)
+    if not user_data:
+        return default
+    return user_data.get(key, default)
+
+def bump_settings_version(user_id: int) -> None:
+    """Mark a user's settings as changed so batch snapshots get refreshed."""
+    SETTINGS_VERSIONS[user_id] = SETTINGS_VERSIONS.get(user_id, 0) + 1
+
+@dataclass(frozen=True)
+class UserSettings:
+    """Snapshot of the settings a batch needs, loaded with a single read."""
+    user_id: int
+    version: int
+    chat_id: Optional[str] = None
+    caption: str = ''
+    rename_tag: str = ''
+    replacement_words: Dict[str, str] = field(default_factory=dict)
+    delete_words: List[str] = field(default_factory=list)
+    loaded_at: float = field(default_factory=time.monotonic)
 
-async def process_text_with_rules(user_id: int, text: str) -> str:
+    @property
+    def is_edited(self) -> bool:
+        """True if the user edited their settings in this process since."""
+        return SETTINGS_VERSIONS.get(self.user_id, 0) != self.version
+
+    @property
+    def is_stale(self) -> bool:
+        """True if edited here, or old enough to miss an edit made elsewhere."""
+        return self.is_edited or time.monotonic() - self.loaded_at > SETTINGS_REFRESH_SECONDS
+
+async def load_user_settings(user_id: int) -> UserSettings:
+    """Load a settings snapshot for a user."""
+    version = SETTINGS_VERSIONS.get(user_id, 0)
+    user_data = await get_user_data(user_id) or {}
+    return UserSettings(
+        user_id=user_id,
+        version=version,
+        chat_id=user_data.get('chat_id'),
+        caption=user_data.get('caption', ''),
+        rename_tag=user_data.get('rename_tag', ''),
+        replacement_words=user_data.get('replacement_words', {}),
+        delete_words=user_data.get('delete_words', [])
+    )
+
+async def refresh_user_settings(settings: UserSettings) -> UserSettings:
+    """Reload a snapshot if the user changed their settings or it has aged."""
+    if not settings.is_stale:
+        return settings
+    if not settings.is_edited:
+        # Edits made by another process are only visible in MongoDB
+        invalidate_user_data(settings.user_id)
+    return await load_user_settings(settings.user_id)
+
+def _alternation(words) -> Optional[Pattern]:
+    """One regex matching any of `words`, longest first."""
+    words = sorted((w for w in words if w), key=len, reverse=True)
+    return re.compile('|'.join(map(re.escape, words))) if words else None
+
+class TextRules:
+    """
+    A user's replacement and deletion rules, compiled once.
+    All replacements are applied in a single regex pass; caption deletions
+    are a set lookup per word, file name deletions one more regex pass.
+    """
+
+    def __init__(self, replacements: Dict[str, str], delete_words: List[str]) -> None:
+        self.replacements = {old: new for old, new in replacements.items() if old}
+        self.delete_words: FrozenSet[str] = frozenset(delete_words)
+        self._replace_pattern = _alternation(self.replacements)
+        self._delete_pattern = _alternation(self.delete_words)
+
+    def replace(self, text: str) -> str:
+        if not self._replace_pattern:
+            return text
+        return self._replace_pattern.sub(lambda m: self.replacements[m.group(0)], text)
+
+    def process_text(self, text: str) -> str:
+        """Replace words, then drop whole words on the delete list."""
+        text = self.replace(text)
+        if self.delete_words:
+            text = " ".join(w for w in text.split() if w not in self.delete_words)
+        return text
+
+    def process_filename(self, name: str) -> str:
+        """Cut delete words out of a file name, then replace words."""
+        if self._delete_pattern:
+            name = self._delete_pattern.sub('', name)
+        return self.replace(name)
+
+def invalidate_text_rules(user_id: int) -> None:
+    """Drop a user's compiled rules (after their rules changed)."""
+    TEXT_RULES_CACHE.pop(user_id, None)
+
+async def get_text_rules(
+    user_id: int,
+    settings: Optional[UserSettings] = None
+) -> TextRules:
+    """
+    Compiled rules for the user's replace/delete lists (from the settings
+    snapshot or the DB); compiled once per SETTINGS_REFRESH_SECONDS unless
+    the lists are saved in between.
+    """
+    entry = TEXT_RULES_CACHE.get(user_id)
+    if entry and time.monotonic() - entry[1] < SETTINGS_REFRESH_SECONDS:
+        TEXT_RULES_CACHE.move_to_end(user_id)
+        return entry[0]
+    
+    if settings:
+        replacements, delete_words = settings.replacement_words, settings.delete_words
+    else:
+        user_data = await get_user_data(user_id) or {}
+        replacements = user_data.get('replacement_words', {})
+        delete_words = user_data.get('delete_words', [])
+    rules = TextRules(replacements or {}, delete_words or [])
+    TEXT_RULES_CACHE[user_id] = (rules, time.monotonic())
+    TEXT_RULES_CACHE.move_to_end(user_id)
+    while len(TEXT_RULES_CACHE) > TEXT_RULES_CACHE_SIZE:
+        TEXT_RULES_CACHE.popitem(last=False)
+    return rules
+
+async def process_text_with_rules(
+    user_id: int,
+    text: str,
+    settings: Optional[UserSettings] = None
+) -> str:
     """Process text according to user's replacement and deletion rules."""
     if not text:
         return ""
     
     try:
-        replacements = await get_user_data_key(user_id, "replacement_words", {})
-        delete_words = await get_user_data_key(user_id, "delete_words", [])
-        
-        # Apply replacements
-        processed_text = text
-        for word, replacement in replacements.items():
-            processed_text = processed_text.replace(word, replacement)
-        
-        # Apply deletions
-        if delete_words:
-            words = processed_text.split()
-            processed_text = " ".join(w for w in words if w not in delete_words)
-        
-        return processed_text
+        rules = await get_text_rules(user_id, settings)
+        return rules.process_text(text)
     except Exception as e:
         logger.error(f"Error processing text: {e}")
         return text
 
-async def screenshot(video_path: str, duration: int, sender: str) -> Optional[str]:
-    """Generate screenshot from video at midpoint."""
-    if (existing := thumbnail(sender)):
-        return existing
+def _parse_probe(stderr: str) -> Dict[str, Any]:
+    """Extract duration, size, codecs and rotation from ffmpeg's input banner."""
+    info: Dict[str, Any] = dict(DEFAULT_VIDEO_METADATA, video_codec=None, audio_codec=None)
+    if (match := PROBE_DURATION_PATTERN.search(stderr)):
+        hours, minutes, seconds = match.groups()
+        info['duration'] = max(1, round(int(hours) * 3600 + int(minutes) * 60 + float(seconds)))
+    if (match := PROBE_VIDEO_PATTERN.search(stderr)):
+        info['video_codec'] = match.group(1)
+        info['width'], info['height'] = max(1, int(match.group(2))), max(1, int(match.group(3)))
+    if (match := PROBE_AUDIO_PATTERN.search(stderr)):
+        info['audio_codec'] = match.group(1)
+    if (match := PROBE_ROTATION_PATTERN.search(stderr)) and abs(round(float(match.group(1)))) % 180 == 90:
+        info['width'], info['height'] = info['height'], info['width']
+    return info
+
+async def probe_media(
+    file_path: str,
+    duration_hint: int = 0,
+    with_thumb: bool = True
+) -> Dict[str, Any]:
+    """
+    Probe a video in one ffmpeg run: the input banner gives width, height,
+    duration and codecs while the same process writes a keyframe thumbnail
+    (at duration_hint / 2 when known, else a representative early frame).
+    Results are cached by path, size and mtime.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError as e:
+        logger.error(f"Media probe failed: {e}")
+        return dict(DEFAULT_VIDEO_METADATA, video_codec=None, audio_codec=None, thumb=None)
     
-    timestamp = hhmmss(duration // 2)
-    output_file = f"{datetime.now().isoformat('_', 'seconds')}.jpg"
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    cached = PROBE_CACHE.get(key)
+    if cached and (not with_thumb or (cached['thumb'] and os.path.exists(cached['thumb']))):
+        PROBE_CACHE.move_to_end(key)
+        return dict(cached)
     
-    try:
-        process = await asyncio.create_subprocess_exec(
-            "ffmpeg", "-ss", timestamp, "-i", video_path,
-            "-frames:v", "1", output_file, "-y",
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
+    thumb = None
+    args = ["ffmpeg", "-hide_banner"]
+    if with_thumb:
+        thumb = os.path.join(
+            os.path.dirname(file_path) or '.',
+            f"thumb_{os.path.basename(file_path)}_{stat.st_mtime_ns}.jpg"
         )
-        await process.communicate()
-        
-        if os.path.isfile(output_file):
-            return output_file
-        return None
-    except Exception as e:
-        logger.error(f"Screenshot generation failed: {e}")
-        return None
-
-async def get_video_metadata(file_path: str) -> Dict[str, int]:
-    """Get video metadata using OpenCV in a threadpool."""
-    def _extract_metadata():
+        if duration_hint > 1:
+            args += ["-skip_frame", "nokey", "-ss", hhmmss(duration_hint // 2)]
+        args += ["-i", file_path, "-frames:v", "1"]
+        if duration_hint <= 1:
+            args += ["-vf", "thumbnail=50"]
+        args += ["-y", thumb]
+    else:
+        args += ["-i", file_path]
+    
+    stderr = ""
+    async with PROBE_SEMAPHORE:
         try:
-            cap = cv2.VideoCapture(file_path)
-            if not cap.isOpened():
-                return DEFAULT_VIDEO_METADATA
-                
-            width = round(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = round(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            fps = cap.get(cv2.CAP_PROP_FPS)
-            frames = cap.get(cv2.CAP_PROP_FRAME_COUNT)
-            
-            duration = round(frames / fps) if fps > 0 else 1
-            cap.release()
-            
-            return {
-                'width': max(1, width),
-                'height': max(1, height),
-                'duration': max(1, duration)
-            }
-        except Exception:
-            return DEFAULT_VIDEO_METADATA
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                _, err = await asyncio.wait_for(process.communicate(), PROBE_TIMEOUT)
+                stderr = err.decode(errors='ignore')
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                logger.error(f"Media probe timed out for {file_path}")
+        except Exception as e:
+            logger.error(f"Media probe failed: {e}")
     
-    try:
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(None, _extract_metadata)
-    except Exception as e:
-        logger.error(f"Video metadata error: {e}")
-        return DEFAULT_VIDEO_METADATA
+    info = _parse_probe(stderr)
+    info['thumb'] = thumb if thumb and os.path.isfile(thumb) else None
+    PROBE_CACHE[key] = info
+    while len(PROBE_CACHE) > PROBE_CACHE_SIZE:
+        PROBE_CACHE.popitem(last=False)
+    return dict(info)
+
+def utc_expiry(expiry_date: datetime) -> datetime:
+    """Naive local expiry as the naive UTC datetime Mongo's TTL index expects."""
+    return expiry_date.astimezone(timezone.utc).replace(tzinfo=None)
 
 async def add_premium_user(
     user_id: int,
@@ -229,20 +557,307 @@ async def add_premium_user(
             {"$set": {
                 "subscription_start": datetime.now(),
                 "subscription_end": expiry_date,
-                "expireAt": expiry_date
+                "expireAt": utc_expiry(expiry_date)
             }},
             upsert=True
         )
+        invalidate_premium_user(user_id)
         return True, expiry_date
     except Exception as e:
         logger.error(f"Premium user add failed: {e}")
         return False, str(e)
 
-async def is_premium_user(user_id: int) -> bool:
-    """Check if user has active premium subscription."""
+def _cache_premium(user_id: int, details: Optional[Dict]) -> None:
+    PREMIUM_CACHE[user_id] = (details, time.monotonic())
+    PREMIUM_CACHE.move_to_end(user_id)
+    while len(PREMIUM_CACHE) > PREMIUM_CACHE_SIZE:
+        PREMIUM_CACHE.popitem(last=False)
+
+def invalidate_premium_user(user_id: int) -> None:
+    """Forget a user's cached premium status (after granting or removing it)."""
+    PREMIUM_CACHE.pop(user_id, None)
+
+async def get_premium_details(user_id: int) -> Optional[Dict]:
+    """Active premium subscription of a user, or None."""
+    entry = PREMIUM_CACHE.get(user_id)
+    if entry:
+        details, checked_at = entry
+        age = time.monotonic() - checked_at
+        if details is not None:
+            if datetime.now() >= details.get("subscription_end", datetime.min):
+                _cache_premium(user_id, None)  # expired just now
+                return None
+            if age < PREMIUM_POSITIVE_TTL:
+                return dict(details)
+        elif age < PREMIUM_NEGATIVE_TTL:
+            return None
+    
     try:
         user = await premium_users_collection.find_one({"user_id": user_id})
-        return user and datetime.now() < user.get("subscription_end", datetime.min)
     except Exception as e:
         logger.error(f"Premium check failed: {e}")
-        return False
\ No newline at end of file
+        return None
+    if not (user and datetime.now() < user.get("subscription_end", datetime.min)):
+        user = None
+    _cache_premium(user_id, user)
+    return dict(user) if user else None
+
+async def is_premium_user(user_id: int) -> bool:
+    """Check if user has active premium subscription."""
+    return await get_premium_details(user_id) is not None
+
+async def preload_premium_users() -> int:
+    """Cache every active subscription at startup; returns how many."""
+    count = 0
+    try:
+        cursor = premium_users_collection.find({"subscription_end": {"$gt": datetime.now()}})
+        async for user in cursor:
+            _cache_premium(user["user_id"], user)
+            count += 1
+        logger.info(f"Preloaded {count} premium subscriptions")
+    except Exception as e:
+        logger.error(f"Premium preload failed: {e}")
+    return count
+
+def media_cache_key(file_unique_id: str, **params: Any) -> str:
+    """Build a dedupe key from a file identity plus its transformation parameters."""
+    payload = json.dumps({'id': file_unique_id, **params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+async def get_cached_media(key: str) -> Optional[Dict[str, Any]]:
+    """
+    Get an already uploaded copy, if any: its file_id (when the bot sent
+    it) and the chat/message it was sent as. Entries from before file_ids
+    were stored only have a LOG_GROUP message ID (chat_id None).
+    """
+    try:
+        doc = await media_cache_collection.find_one_and_update(
+            {"key": key},
+            {"$inc": {"hits": 1}, "$set": {"last_used": datetime.now()}}
+        )
+    except Exception as e:
+        logger.error(f"Media cache lookup failed: {e}")
+        return None
+    
+    if doc:
+        MEDIA_CACHE_STATS['hits'] += 1
+        return {
+            "file_id": doc.get("file_id"),
+            "chat_id": doc.get("chat_id"),
+            "message_id": doc.get("message_id", doc.get("log_message_id"))
+        }
+    MEDIA_CACHE_STATS['misses'] += 1
+    return None
+
+async def save_cached_media(
+    key: str,
+    chat_id: Any,
+    message_id: int,
+    file_id: Optional[str] = None
+) -> bool:
+    """Remember the message an uploaded file was sent as (and its file_id)."""
+    try:
+        await media_cache_collection.update_one(
+            {"key": key},
+            {"$set": {
+                "chat_id": chat_id,
+                "message_id": message_id,
+                "file_id": file_id,
+                "created_at": datetime.now(),
+                "last_used": datetime.now()
+            }, "$setOnInsert": {"hits": 0}},
+            upsert=True
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Media cache save failed: {e}")
+        return False
+
+async def evict_cached_media(key: str) -> None:
+    """Forget a cached copy (e.g. the LOG_GROUP message was deleted)."""
+    try:
+        await media_cache_collection.delete_one({"key": key})
+        MEDIA_CACHE_STATS['evictions'] += 1
+    except Exception as e:
+        logger.error(f"Media cache eviction failed: {e}")
+
+def get_media_cache_stats() -> Dict[str, Union[int, float]]:
+    """Get media dedupe cache counters and hit rate."""
+    lookups = MEDIA_CACHE_STATS['hits'] + MEDIA_CACHE_STATS['misses']
+    return {
+        **MEDIA_CACHE_STATS,
+        'hit_rate': MEDIA_CACHE_STATS['hits'] / lookups if lookups else 0.0
+    }
+
+async def ensure_indexes() -> None:
+    """
+    Create the indexes the bot's queries rely on (idempotent).
+    A unique index that cannot be built because of duplicate documents
+    is created as a plain index instead, so lookups are still indexed.
+    """
+    for collection, keys, options in INDEXES:
+        try:
+            await collection.create_index(keys, **options)
+        except OperationFailure as e:
+            if not options.get("unique"):
+                logger.error(f"Index {keys} on {collection.name} failed: {e}")
+                continue
+            logger.warning(
+                f"Unique index {keys} on {collection.name} failed ({e}); "
+                f"creating a non-unique one. Remove the duplicates to enforce it."
+            )
+            try:
+                await collection.create_index(keys)
+            except Exception as e:
+                logger.error(f"Index {keys} on {collection.name} failed: {e}")
+        except Exception as e:
+            logger.error(f"Index {keys} on {collection.name} failed: {e}")
+    await check_query_plans()
+
+async def check_query_plans() -> None:
+    """Warn about hot queries that MongoDB would answer with a collection scan."""
+    hot_queries = [
+        (users_collection, {"user_id": 0}),
+        (premium_users_collection, {"user_id": 0}),
+        (media_cache_collection, {"key": ""}),
+        (jobs_collection, {"user_id": 0, "status": {"$in": ["queued", "running"]}}),
+        (jobs_collection, {"status": "queued"}),
+    ]
+    for collection, query in hot_queries:
+        try:
+            plan = await collection.find(query).limit(1).explain()
+            winning = plan.get("queryPlanner", {}).get("winningPlan", {})
+            if "COLLSCAN" in json.dumps(winning, default=str):
+                logger.warning(f"Query {query} on {collection.name} does a COLLSCAN")
+        except Exception as e:
+            logger.error(f"Explain of {query} on {collection.name} failed: {e}")
+
+async def enqueue_job(user_id: int, batch_info: Dict[str, Any]) -> Optional[Any]:
+    """Queue a batch for the worker processes."""
+    try:
+        result = await jobs_collection.insert_one({
+            "user_id": user_id,
+            "status": "queued",
+            "batch": batch_info,
+            "progress": {"current": batch_info.get("current", 0), "success": batch_info.get("success", 0)},
+            "cancel_requested": False,
+            "attempts": 0,
+            "lease_owner": None,
+            "lease_expires": None,
+            "created_at": datetime.now()
+        })
+        return result.inserted_id
+    except Exception as e:
+        logger.error(f"Job enqueue failed: {e}")
+        return None
+
+async def claim_job(worker_id: str, lease_seconds: int) -> Optional[Dict[str, Any]]:
+    """
+    Atomically claim the oldest queued job, or a running job whose worker
+    stopped heartbeating, and lease it to `worker_id`.
+    """
+    now = datetime.now()
+    try:
+        # Jobs that crashed their worker too often will never be claimed again
+        await jobs_collection.update_many(
+            {
+                "status": "running",
+                "lease_expires": {"$lt": now},
+                "attempts": {"$gte": JOB_MAX_ATTEMPTS}
+            },
+            {"$set": {"status": "failed", "finished_at": now, "lease_expires": None}}
+        )
+        return await jobs_collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "lease_expires": {"$lt": now}}
+                ],
+                "cancel_requested": False,
+                "attempts": {"$lt": JOB_MAX_ATTEMPTS}
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_owner": worker_id,
+                    "lease_expires": now + timedelta(seconds=lease_seconds),
+                    "claimed_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    except Exception as e:
+        logger.error(f"Job claim failed: {e}")
+        return None
+
+async def heartbeat_job(
+    job_id: Any,
+    worker_id: str,
+    lease_seconds: int,
+    progress: Optional[Dict[str, int]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Extend a job lease and store its progress; None if the lease was lost.
+    Database errors are raised, not reported as a lost lease.
+    """
+    update = {"lease_expires": datetime.now() + timedelta(seconds=lease_seconds)}
+    if progress:
+        update["progress"] = progress
+    return await jobs_collection.find_one_and_update(
+        {"_id": job_id, "lease_owner": worker_id, "status": "running"},
+        {"$set": update},
+        return_document=ReturnDocument.AFTER
+    )
+
+async def complete_job(
+    job_id: Any,
+    worker_id: str,
+    status: str,
+    progress: Optional[Dict[str, int]] = None
+) -> None:
+    """Mark a leased job as done, cancelled or failed."""
+    update = {"status": status, "finished_at": datetime.now(), "lease_expires": None}
+    if progress:
+        update["progress"] = progress
+    try:
+        await jobs_collection.update_one(
+            {"_id": job_id, "lease_owner": worker_id},
+            {"$set": update}
+        )
+    except Exception as e:
+        logger.error(f"Job completion failed: {e}")
+
+async def get_active_job(user_id: int) -> Optional[Dict[str, Any]]:
+    """Get a user's queued or running job, if any."""
+    try:
+        return await jobs_collection.find_one(
+            {"user_id": user_id, "status": {"$in": ["queued", "running"]}}
+        )
+    except Exception as e:
+        logger.error(f"Job lookup failed: {e}")
+        return None
+
+async def request_job_cancel(user_id: int) -> bool:
+    """
+    Cancel a user's jobs: queued ones (and ones whose worker died) end at
+    once, running ones are flagged for their worker to stop.
+    """
+    now = datetime.now()
+    try:
+        dropped = await jobs_collection.update_many(
+            {"user_id": user_id, "$or": [
+                {"status": "queued"},
+                {"status": "running", "lease_expires": {"$lt": now}}
+            ]},
+            {"$set": {"status": "cancelled", "finished_at": now}}
+        )
+        flagged = await jobs_collection.update_many(
+            {"user_id": user_id, "status": "running"},
+            {"$set": {"cancel_requested": True}}
+        )
+        return bool(dropped.modified_count or flagged.modified_count)
+    except Exception as e:
+        logger.error(f"Job cancel failed: {e}")
+        return False
@@ -0,0 +1,109 @@
+import time
+import asyncio
+import logging
+import weakref
+from typing import Any, Awaitable, Callable, TypeVar
+from pyrogram.errors import FloodWait
+from config import RATE_LIMIT_PER_SECOND, RATE_LIMIT_BURST, FLOOD_WAIT_RETRIES
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate adapts to Telegram FloodWait errors."""
+
+    MIN_RATE = 0.05  # never slower than one call per 20 seconds
+    RECOVERY_STEP = 0.05  # tokens/second regained per successful call
+
+    def __init__(
+        self,
+        rate: float = RATE_LIMIT_PER_SECOND,
+        burst: int = RATE_LIMIT_BURST
+    ) -> None:
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.flood_waits = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self) -> None:
+        """Wait until a call may be made, honoring any pending FloodWait."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_flood_wait(self, seconds: float) -> None:
+        """Block for exactly as long as Telegram asked and halve the rate."""
+        self.flood_waits += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.rate = max(self.MIN_RATE, self.rate / 2)
+        self.tokens = 0.0
+        self.updated = self.blocked_until
+
+    def on_success(self) -> None:
+        """Ramp the rate back up towards its configured maximum."""
+        if self.rate < self.max_rate:
+            self.rate = min(self.max_rate, self.rate + self.RECOVERY_STEP)
+
+# One limiter per client object (bot, per-user UB bots, UC user clients)
+_limiters: "weakref.WeakKeyDictionary[Any, AdaptiveRateLimiter]" = weakref.WeakKeyDictionary()
+
+def get_limiter(
+    client: Any,
+    rate: float = RATE_LIMIT_PER_SECOND,
+    burst: int = RATE_LIMIT_BURST
+) -> AdaptiveRateLimiter:
+    """
+    Get or create the rate limiter shared by all calls on a client.
+    `rate` and `burst` only apply when the limiter is created.
+    """
+    limiter = _limiters.get(client)
+    if limiter is None:
+        limiter = _limiters[client] = AdaptiveRateLimiter(rate, burst)
+    return limiter
+
+async def call_limited(
+    client: Any,
+    func: Callable[..., Awaitable[T]],
+    *args: Any,
+    **kwargs: Any
+) -> T:
+    """
+    Call a client method through the client's rate limiter.
+    FloodWait errors are retried up to FLOOD_WAIT_RETRIES times after
+    waiting the exact duration requested by Telegram.
+    """
+    limiter = get_limiter(client)
+    for attempt in range(FLOOD_WAIT_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            result = await func(*args, **kwargs)
+        except FloodWait as e:
+            wait = float(e.value or 0)
+            limiter.on_flood_wait(wait)
+            logger.warning(
+                f"FloodWait of {wait:.0f}s on {getattr(func, '__name__', func)}, "
+                f"rate lowered to {limiter.rate:.2f}/s"
+            )
+            if attempt == FLOOD_WAIT_RETRIES:
+                raise
+            continue
+        limiter.on_success()
+        return result
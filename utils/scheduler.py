@@ -0,0 +1,152 @@
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from config import MAX_CONCURRENT_BATCHES, MAX_BATCHES_PER_USER, PREMIUM_WEIGHT
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+@dataclass(eq=False)
+class ScheduledJob:
+    """A unit of work waiting for or holding a scheduler slot."""
+    user_id: int
+    cost: int  # messages left to process
+    weight: float
+    start_tag: float = 0.0
+    finish_tag: float = 0.0
+    remaining: int = 0
+    started_at: Optional[float] = None
+    cancelled: bool = False
+    ready: asyncio.Event = field(default_factory=asyncio.Event)
+
+class FairScheduler:
+    """
+    Weighted fair queue for batch jobs.
+    At most `max_running` jobs run at once and at most `per_user` per user.
+    Waiting jobs are started in order of their virtual finish tag, so a
+    user with weight 3 gets three times the share of a weight-1 user and
+    one huge batch cannot starve everybody queued behind it.
+    """
+
+    DEFAULT_SECONDS_PER_ITEM = 10.0  # ETA guess before anything finished
+    EMA_ALPHA = 0.2
+
+    def __init__(
+        self,
+        max_running: int = MAX_CONCURRENT_BATCHES,
+        per_user: int = MAX_BATCHES_PER_USER,
+        premium_weight: float = PREMIUM_WEIGHT
+    ) -> None:
+        self.max_running = max_running
+        self.per_user = per_user
+        self.premium_weight = premium_weight
+        self.virtual_time = 0.0
+        self.waiting: List[ScheduledJob] = []
+        self.running: List[ScheduledJob] = []
+        self.last_finish: Dict[int, float] = {}
+        self.seconds_per_item = self.DEFAULT_SECONDS_PER_ITEM
+        self._last_progress: Dict[int, float] = {}
+
+    def weight_for(self, premium: bool) -> float:
+        return self.premium_weight if premium else 1.0
+
+    def submit(self, user_id: int, cost: int, premium: bool = False) -> ScheduledJob:
+        """Queue a job; await wait() on it before doing the work."""
+        weight = self.weight_for(premium)
+        job = ScheduledJob(user_id=user_id, cost=max(1, cost), weight=weight, remaining=cost)
+        job.start_tag = max(self.virtual_time, self.last_finish.get(user_id, 0.0))
+        job.finish_tag = job.start_tag + job.cost / weight
+        self.last_finish[user_id] = job.finish_tag
+        self.waiting.append(job)
+        self._dispatch()
+        return job
+
+    async def wait(self, job: ScheduledJob) -> bool:
+        """Wait for the job's turn. False if it was cancelled while queued."""
+        try:
+            await job.ready.wait()
+        except asyncio.CancelledError:
+            self.cancel(job)
+            raise
+        return not job.cancelled
+
+    def cancel(self, job: ScheduledJob) -> None:
+        """Drop a job that has not started yet."""
+        if job in self.waiting:
+            self.waiting.remove(job)
+            job.cancelled = True
+            job.ready.set()
+
+    def cancel_user(self, user_id: int) -> bool:
+        """Cancel a user's queued jobs; True if any were waiting."""
+        jobs = [job for job in self.waiting if job.user_id == user_id]
+        for job in jobs:
+            self.cancel(job)
+        return bool(jobs)
+
+    def progress(self, job: ScheduledJob, remaining: int) -> None:
+        """Record progress of a running job (feeds the ETA estimate)."""
+        now = time.monotonic()
+        done = job.remaining - remaining
+        last = self._last_progress.get(id(job), job.started_at or now)
+        if done > 0:
+            # Jobs run concurrently, so per-item time is measured per job
+            sample = (now - last) / done
+            self.seconds_per_item += self.EMA_ALPHA * (sample - self.seconds_per_item)
+            self._last_progress[id(job)] = now
+        job.remaining = remaining
+
+    def finish(self, job: ScheduledJob) -> None:
+        """Release the slot held by a job and start the next ones."""
+        if job in self.running:
+            self.running.remove(job)
+        self.cancel(job)
+        self._last_progress.pop(id(job), None)
+        self._dispatch()
+
+    def _user_running(self, user_id: int) -> int:
+        return sum(1 for job in self.running if job.user_id == user_id)
+
+    def _eligible(self) -> List[ScheduledJob]:
+        """Waiting jobs whose user is below the per-user cap, in start order."""
+        return sorted(
+            (job for job in self.waiting if self._user_running(job.user_id) < self.per_user),
+            key=lambda job: job.finish_tag
+        )
+
+    def _dispatch(self) -> None:
+        while len(self.running) < self.max_running:
+            eligible = self._eligible()
+            if not eligible:
+                return
+            job = eligible[0]
+            self.waiting.remove(job)
+            self.running.append(job)
+            self.virtual_time = max(self.virtual_time, job.start_tag)
+            job.started_at = time.monotonic()
+            job.ready.set()
+
+    def find(self, user_id: int) -> Optional[ScheduledJob]:
+        for job in self.running + self.waiting:
+            if job.user_id == user_id:
+                return job
+        return None
+
+    def position(self, job: ScheduledJob) -> int:
+        """1-based queue position of a waiting job (0 if running)."""
+        if job in self.running:
+            return 0
+        ordered = sorted(self.waiting, key=lambda j: j.finish_tag)
+        return ordered.index(job) + 1 if job in ordered else 0
+
+    def eta(self, job: ScheduledJob) -> float:
+        """Estimated seconds until the job finishes."""
+        own = job.remaining * self.seconds_per_item
+        if job in self.running:
+            return own
+        ahead = sorted(self.waiting, key=lambda j: j.finish_tag)
+        ahead = ahead[:ahead.index(job)] if job in ahead else ahead
+        backlog = sum(j.remaining for j in self.running) + sum(j.remaining for j in ahead)
+        return backlog * self.seconds_per_item / max(1, self.max_running) + own
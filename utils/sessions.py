@@ -0,0 +1,78 @@
+import os
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional
+from pyrogram.storage import FileStorage, MemoryStorage
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Session files hold decrypted auth keys: they live in a private directory
+# (0700, files 0600) and are removed when the client is evicted or logs out
+SESSION_WORKDIR = "sessions"
+LEGACY_SESSION_WORKDIR = "."  # where earlier versions left them
+
+def session_fingerprint(session_string: str) -> str:
+    """Short stable fingerprint of a session string."""
+    return hashlib.sha256(session_string.encode()).hexdigest()[:32]
+
+def session_paths(name: str, workdir: Optional[str] = None):
+    """Paths of a persisted session and its fingerprint marker."""
+    base = os.path.join(workdir or SESSION_WORKDIR, name)
+    return f"{base}.session", f"{base}.fingerprint"
+
+def ensure_session_workdir() -> None:
+    """Create the session directory, readable by the bot's user only."""
+    os.makedirs(SESSION_WORKDIR, mode=0o700, exist_ok=True)
+    os.chmod(SESSION_WORKDIR, 0o700)
+
+def drop_session_file(name: str) -> None:
+    """Remove a persisted session so the next start is seeded again."""
+    for workdir in (SESSION_WORKDIR, LEGACY_SESSION_WORKDIR):
+        for path in session_paths(name, workdir):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.error(f"Error removing {path}: {e}")
+
+async def seed_session_file(name: str, session_string: str) -> bool:
+    """
+    Make sure `<name>.session` holds the auth key of `session_string`.
+    The file keeps pyrogram's peer cache across restarts, so a client
+    started from it skips re-importing the session and re-learning peers.
+    Returns True if a matching session file already existed (warm start).
+    """
+    ensure_session_workdir()
+    session_file, marker = session_paths(name)
+    fingerprint = session_fingerprint(session_string)
+    if os.path.exists(session_file) and os.path.exists(marker):
+        with open(marker) as f:
+            if f.read().strip() == fingerprint:
+                return True
+
+    drop_session_file(name)  # also any copy left in the legacy location
+    memory = MemoryStorage(name, session_string)
+    storage = None
+    try:
+        await memory.open()
+        storage = FileStorage(name, Path(SESSION_WORKDIR))
+        await storage.open()
+        await storage.dc_id(await memory.dc_id())
+        await storage.api_id(await memory.api_id())
+        await storage.test_mode(await memory.test_mode())
+        await storage.auth_key(await memory.auth_key())
+        await storage.user_id(await memory.user_id())
+        await storage.is_bot(await memory.is_bot())
+        await storage.save()
+        os.chmod(session_file, 0o600)
+    finally:
+        if storage is not None and storage.conn is not None:
+            await storage.close()
+        if memory.conn is not None:
+            await memory.close()
+
+    with open(os.open(marker, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+        f.write(fingerprint)
+    return False
@@ -0,0 +1,210 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import logging
+from typing import Dict, Optional
+from config import (
+    STORAGE_DIR,
+    STORAGE_BUDGET,
+    TMPFS_DIR,
+    TMPFS_BUDGET,
+    TMPFS_MAX_FILE,
+    STORAGE_SWEEP_INTERVAL,
+    STORAGE_ORPHAN_AGE
+)
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class StorageLease:
+    """A per-job directory plus the bytes reserved for it."""
+
+    def __init__(self, path: str, reserved: int, tmpfs: bool) -> None:
+        self.path = path
+        self.reserved = reserved
+        self.tmpfs = tmpfs
+
+    def file(self, name: str) -> str:
+        """Path for a file inside the job directory."""
+        return os.path.join(self.path, os.path.basename(name))
+
+class StorageManager:
+    """
+    Hands out per-job directories under a disk budget.
+    Jobs wait (admission control) while the budget is used up; small files
+    are staged on tmpfs. Directory names carry the owner's PID so the
+    sweeper can tell live jobs of other processes from orphans.
+    """
+
+    ADMISSION_TIMEOUT = 300  # admit over budget rather than wait forever
+    TMPFS_MARGIN = 16 * 1024 * 1024  # keep free on tmpfs (e.g. Docker's 64MB /dev/shm)
+
+    def __init__(
+        self,
+        root: str = STORAGE_DIR,
+        budget: int = STORAGE_BUDGET,
+        tmpfs_root: Optional[str] = TMPFS_DIR,
+        tmpfs_budget: int = TMPFS_BUDGET,
+        tmpfs_max_file: int = TMPFS_MAX_FILE
+    ) -> None:
+        self.root = os.path.abspath(os.path.join(root, "jobs"))
+        self.budget = budget
+        self.tmpfs_mount = tmpfs_root if tmpfs_root and os.path.isdir(tmpfs_root) else None
+        self.tmpfs_root = os.path.join(self.tmpfs_mount, "tg_saver_jobs") if self.tmpfs_mount else None
+        self.tmpfs_budget = tmpfs_budget
+        self.tmpfs_max_file = tmpfs_max_file
+        self.reserved = 0
+        self.tmpfs_reserved = 0
+        self.leases: Dict[str, StorageLease] = {}
+        self._changed: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _fits(self, size: int) -> bool:
+        # A job larger than the whole budget still runs, but alone
+        if not self.leases:
+            return True
+        if self.reserved + size > self.budget:
+            return False
+        os.makedirs(self.root, exist_ok=True)
+        return shutil.disk_usage(self.root).free > size
+
+    def _fits_tmpfs(self, size: int) -> bool:
+        """Small known-size files go to tmpfs if both budget and real space allow."""
+        if not (self.tmpfs_root and 0 < size <= self.tmpfs_max_file):
+            return False
+        if self.tmpfs_reserved + size > self.tmpfs_budget:
+            return False
+        try:
+            free = shutil.disk_usage(self.tmpfs_mount).free
+        except OSError:
+            return False
+        # Other leases may not have written their files yet
+        return free - (self.tmpfs_reserved + size) >= self.TMPFS_MARGIN
+
+    async def acquire(self, size: int, tmpfs: bool = True) -> StorageLease:
+        """
+        Reserve `size` bytes and create a job directory, waiting for room.
+        Pass tmpfs=False to force the disk (e.g. after tmpfs ran out of space).
+        """
+        size = max(0, int(size or 0))
+        condition = self._condition()
+        async with condition:
+            tmpfs = tmpfs and self._fits_tmpfs(size)
+            if tmpfs:
+                self.tmpfs_reserved += size
+            else:
+                try:
+                    await asyncio.wait_for(
+                        condition.wait_for(lambda: self._fits(size)),
+                        self.ADMISSION_TIMEOUT
+                    )
+                except asyncio.TimeoutError:
+                    # Jobs holding the budget may be waiting on this one
+                    logger.warning(f"Storage budget exhausted, admitting {size} bytes anyway")
+                self.reserved += size
+
+        base = self.tmpfs_root if tmpfs else self.root
+        path = os.path.join(base, f"{os.getpid()}-{uuid.uuid4().hex[:12]}")
+        lease = StorageLease(path, size, tmpfs)
+        self.leases[path] = lease  # registered first so the sweeper skips it
+        os.makedirs(path, exist_ok=True)
+        return lease
+
+    async def release(self, lease: Optional[StorageLease]) -> None:
+        """Delete a job directory and return its reservation."""
+        if lease is None or self.leases.pop(lease.path, None) is None:
+            return
+        await asyncio.to_thread(shutil.rmtree, lease.path, True)
+        condition = self._condition()
+        async with condition:
+            if lease.tmpfs:
+                self.tmpfs_reserved -= lease.reserved
+            else:
+                self.reserved -= lease.reserved
+            condition.notify_all()
+
+    async def move_to_disk(self, lease: StorageLease) -> StorageLease:
+        """Swap a tmpfs lease for a disk lease of the same size (contents are dropped)."""
+        await self.release(lease)
+        return await self.acquire(lease.reserved, tmpfs=False)
+
+    @staticmethod
+    def _owner_alive(name: str) -> bool:
+        pid = name.split("-", 1)[0]
+        if not pid.isdigit():
+            return False
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def sweep(self) -> int:
+        """
+        Remove orphaned job directories (owner process gone, or owned by
+        this process but not leased) and stale loose files in STORAGE_DIR.
+        Returns the number of entries removed.
+        """
+        removed = 0
+        for base in filter(None, (self.root, self.tmpfs_root)):
+            if not os.path.isdir(base):
+                continue
+            for name in os.listdir(base):
+                path = os.path.join(base, name)
+                mine = name.startswith(f"{os.getpid()}-")
+                if path in self.leases or (not mine and self._owner_alive(name)):
+                    continue
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+
+        # Files left directly in STORAGE_DIR by older versions or crashes
+        deadline = time.time() - STORAGE_ORPHAN_AGE
+        root = os.path.dirname(self.root)
+        if os.path.isdir(root):
+            for name in os.listdir(root):
+                path = os.path.join(root, name)
+                try:
+                    if os.path.isfile(path) and os.path.getmtime(path) < deadline:
+                        os.remove(path)
+                        removed += 1
+                except OSError as e:
+                    logger.error(f"Error removing orphan {path}: {e}")
+        if removed:
+            logger.info(f"Storage sweeper removed {removed} orphaned entries")
+        return removed
+
+    def stats(self) -> Dict[str, int]:
+        """Current reservations and job counts."""
+        return {
+            'jobs': len(self.leases),
+            'reserved': self.reserved,
+            'budget': self.budget,
+            'tmpfs_reserved': self.tmpfs_reserved,
+            'tmpfs_budget': self.tmpfs_budget if self.tmpfs_root else 0
+        }
+
+storage = StorageManager()
+_sweeper: Optional[asyncio.Task] = None
+
+async def run_storage_sweeper(interval: float = STORAGE_SWEEP_INTERVAL) -> None:
+    """Sweep orphans now and then every `interval` seconds."""
+    while True:
+        try:
+            await asyncio.to_thread(storage.sweep)
+        except Exception as e:
+            logger.error(f"Storage sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+def start_storage_sweeper() -> None:
+    """Start the sweeper once per process."""
+    global _sweeper
+    if _sweeper is None or _sweeper.done():
+        _sweeper = asyncio.create_task(run_storage_sweeper())
@@ -0,0 +1,119 @@
+import io
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional, Tuple
+from PIL import Image
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Telegram thumbnail limits
+THUMB_MAX_SIDE = 320
+THUMB_MAX_BYTES = 200 * 1024
+
+class ThumbnailService:
+    """
+    Serves users' custom thumbnails ({user_id}.jpg) from memory.
+    Thumbnails are scaled to Telegram's limits once, when they are set;
+    the bytes (or the fact that a user has none) are kept in a bounded
+    LRU so uploads never touch the disk. Entries expire after `ttl`
+    seconds so other processes pick up changes too.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 300) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[Optional[bytes], Optional[int], float]]" = OrderedDict()
+
+    @staticmethod
+    def path(user_id: int) -> str:
+        return f'{user_id}.jpg'
+
+    @staticmethod
+    def scale(data: bytes) -> bytes:
+        """Scale an image to at most 320px per side and 200KB as JPEG."""
+        with Image.open(io.BytesIO(data)) as image:
+            image = image.convert('RGB')
+            image.thumbnail((THUMB_MAX_SIDE, THUMB_MAX_SIDE))
+            for quality in (90, 80, 70, 60, 50, 40):
+                output = io.BytesIO()
+                image.save(output, 'JPEG', quality=quality, optimize=True)
+                if output.tell() <= THUMB_MAX_BYTES:
+                    break
+            return output.getvalue()
+
+    @staticmethod
+    def fits(data: bytes) -> bool:
+        """Whether an image is already within Telegram's thumbnail limits."""
+        if len(data) > THUMB_MAX_BYTES:
+            return False
+        with Image.open(io.BytesIO(data)) as image:
+            return image.format == 'JPEG' and max(image.size) <= THUMB_MAX_SIDE
+
+    def _load(self, user_id: int) -> Tuple[Optional[bytes], Optional[int]]:
+        path = self.path(user_id)
+        if not os.path.exists(path):
+            return None, None
+        with open(path, 'rb') as f:
+            data = f.read()
+        if not self.fits(data):
+            # Set before thumbnails were pre-scaled: scale it now, once
+            data = self.scale(data)
+            self._write(path, data)
+        return data, os.stat(path).st_mtime_ns
+
+    @staticmethod
+    def _write(path: str, data: bytes) -> None:
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def _store(self, user_id: int, source_path: str) -> Tuple[bytes, int]:
+        with open(source_path, 'rb') as f:
+            data = self.scale(f.read())
+        path = self.path(user_id)
+        self._write(path, data)
+        if os.path.abspath(source_path) != os.path.abspath(path):
+            os.remove(source_path)
+        return data, os.stat(path).st_mtime_ns
+
+    async def _entry(self, user_id: int) -> Tuple[Optional[bytes], Optional[int]]:
+        entry = self._entries.get(user_id)
+        if entry and time.monotonic() - entry[2] < self.ttl:
+            self._entries.move_to_end(user_id)
+            return entry[0], entry[1]
+        try:
+            data, stamp = await asyncio.to_thread(self._load, user_id)
+        except Exception as e:
+            logger.error(f"Error loading thumbnail of {user_id}: {e}")
+            data, stamp = None, None
+        self._entries[user_id] = (data, stamp, time.monotonic())
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return data, stamp
+
+    async def get(self, user_id: int) -> Optional[io.BytesIO]:
+        """The user's custom thumbnail as a fresh file object, or None."""
+        data, _ = await self._entry(user_id)
+        if data is None:
+            return None
+        thumb = io.BytesIO(data)
+        thumb.name = 'thumb.jpg'
+        return thumb
+
+    async def stamp(self, user_id: int) -> Optional[int]:
+        """Version of the user's thumbnail (for cache keys), or None."""
+        return (await self._entry(user_id))[1]
+
+    async def store(self, user_id: int, source_path: str) -> None:
+        """Scale a newly uploaded thumbnail into place and cache it."""
+        data, stamp = await asyncio.to_thread(self._store, user_id, source_path)
+        self._entries[user_id] = (data, stamp, time.monotonic())
+
+    def invalidate(self, user_id: int) -> None:
+        """Forget a cached thumbnail (after it was removed or reset)."""
+        self._entries.pop(user_id, None)
+
+thumbnails = ThumbnailService()
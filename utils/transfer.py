@@ -0,0 +1,416 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+from pyrogram import Client, raw, utils as pyro_utils
+from pyrogram.session import Session
+from pyrogram.types import Message
+from config import DOWNLOAD_WORKERS, UPLOAD_WORKERS, UPLOAD_PART_RETRIES
+from utils.ratelimit import call_limited, get_limiter
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Telegram upload constraints
+PART_SIZE = 512 * 1024  # largest part size accepted by upload.save*FilePart
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024  # files above this must use saveBigFilePart
+STREAM_BUFFER_PARTS = 8  # parts held in memory between download and upload (4MB)
+
+# Upload parts go over dedicated media sessions, as in pyrogram's save_file
+WORKERS_PER_SESSION = 4  # save_file's own worker count per media session
+PART_RATE = 50.0  # parts/second per media session until a FloodWait lowers it
+
+# Parallel downloads
+DOWNLOAD_CHUNK = 1024 * 1024  # stream_media offsets/limits count 1MB chunks
+SEGMENT_RETRIES = 3
+
+# Download throughput by method, used to report the parallel speedup
+DOWNLOAD_STATS = {
+    kind: {'files': 0, 'bytes': 0, 'seconds': 0.0}
+    for kind in ('sequential', 'parallel')
+}
+
+InputUploadedFile = Union[raw.types.InputFile, raw.types.InputFileBig]
+
+async def rechunk(chunks: AsyncIterator[bytes], part_size: int = PART_SIZE) -> AsyncIterator[bytes]:
+    """Re-slice an async byte stream into fixed-size upload parts."""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= part_size:
+            yield bytes(buffer[:part_size])
+            del buffer[:part_size]
+    if buffer:
+        yield bytes(buffer)
+
+def save_part_request(
+    file_id: int,
+    part_index: int,
+    total_parts: int,
+    data: bytes,
+    is_big: bool
+) -> Any:
+    """Build the raw save*FilePart request for one part."""
+    if is_big:
+        return raw.functions.upload.SaveBigFilePart(
+            file_id=file_id,
+            file_part=part_index,
+            file_total_parts=total_parts,
+            bytes=data
+        )
+    return raw.functions.upload.SaveFilePart(
+        file_id=file_id,
+        file_part=part_index,
+        bytes=data
+    )
+
+def input_file(
+    file_id: int,
+    total_parts: int,
+    file_name: str,
+    is_big: bool
+) -> InputUploadedFile:
+    """Build the InputFile reference for a completed upload."""
+    if is_big:
+        return raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name)
+    return raw.types.InputFile(id=file_id, parts=total_parts, name=file_name, md5_checksum="")
+
+@asynccontextmanager
+async def media_sessions(client: Client, count: int = 1) -> AsyncIterator[List[Session]]:
+    """
+    Open `count` media sessions on the client's home DC for upload parts,
+    keeping them off the main session's RPC and update traffic. Each
+    session gets its own FloodWait-aware rate limiter.
+    """
+    sessions: List[Session] = []
+    try:
+        for _ in range(max(1, count)):
+            session = Session(
+                client,
+                await client.storage.dc_id(),
+                await client.storage.auth_key(),
+                await client.storage.test_mode(),
+                is_media=True
+            )
+            await session.start()
+            sessions.append(session)
+            get_limiter(session, PART_RATE, WORKERS_PER_SESSION)
+        yield sessions
+    finally:
+        for session in sessions:
+            await session.stop()
+
+async def upload_stream(
+    client: Client,
+    chunks: AsyncIterator[bytes],
+    file_size: int,
+    file_name: str,
+    progress: Optional[Callable] = None,
+    progress_args: tuple = ()
+) -> InputUploadedFile:
+    """
+    Upload a byte stream of known size part by part over a media session.
+    Only STREAM_BUFFER_PARTS parts are buffered in memory; the producer
+    pauses while the buffer is full.
+    """
+    total_parts = math.ceil(file_size / PART_SIZE)
+    is_big = file_size > BIG_FILE_THRESHOLD
+    file_id = client.rnd_id()
+    buffer: asyncio.Queue = asyncio.Queue(maxsize=STREAM_BUFFER_PARTS)
+
+    async def produce() -> None:
+        try:
+            async for part in rechunk(chunks):
+                await buffer.put(part)
+        finally:
+            await buffer.put(None)
+
+    producer = asyncio.create_task(produce())
+    uploaded = 0
+    index = 0
+    try:
+        async with media_sessions(client) as (session,):
+            while (part := await buffer.get()) is not None:
+                if index >= total_parts:
+                    raise ValueError("Stream is longer than the declared file size")
+                await call_limited(
+                    session, session.invoke,
+                    save_part_request(file_id, index, total_parts, part, is_big)
+                )
+                index += 1
+                uploaded += len(part)
+                if progress:
+                    await progress(min(uploaded, file_size), file_size, *progress_args)
+        await producer  # surface download errors
+    finally:
+        if not producer.done():
+            producer.cancel()
+
+    if index != total_parts:
+        raise ValueError("Stream ended before the declared file size")
+    return input_file(file_id, total_parts, file_name, is_big)
+
+async def upload_file_parallel(
+    client: Client,
+    file_path: str,
+    workers: int = UPLOAD_WORKERS,
+    progress: Optional[Callable] = None,
+    progress_args: tuple = ()
+) -> InputUploadedFile:
+    """
+    Upload a local file with `workers` save*FilePart requests in flight,
+    spread over one media session per WORKERS_PER_SESSION workers.
+    Parts may complete in any order; a failed part is retried on its own
+    up to UPLOAD_PART_RETRIES times instead of restarting the upload.
+    """
+    file_size = os.path.getsize(file_path)
+    if not file_size:
+        raise ValueError("File is empty")
+    total_parts = math.ceil(file_size / PART_SIZE)
+    is_big = file_size > BIG_FILE_THRESHOLD
+    file_id = client.rnd_id()
+    parts: asyncio.Queue = asyncio.Queue()
+    for index in range(total_parts):
+        parts.put_nowait(index)
+    workers = max(1, workers)
+    uploaded = 0
+    fd = os.open(file_path, os.O_RDONLY)
+    
+    async def upload_part(session: Session, index: int) -> int:
+        data = await asyncio.to_thread(os.pread, fd, PART_SIZE, index * PART_SIZE)
+        if len(data) != min(PART_SIZE, file_size - index * PART_SIZE):
+            raise ValueError(f"File changed size during upload (part {index}/{total_parts})")
+        request = save_part_request(file_id, index, total_parts, data, is_big)
+        attempt = 0
+        while True:
+            try:
+                await call_limited(session, session.invoke, request)
+                return len(data)
+            except Exception as e:
+                attempt += 1
+                if attempt > UPLOAD_PART_RETRIES:
+                    raise
+                logger.warning(f"Retrying upload part {index}/{total_parts} ({attempt}): {e}")
+                await asyncio.sleep(attempt)
+    
+    async def worker(session: Session) -> None:
+        nonlocal uploaded
+        while not parts.empty():
+            uploaded += await upload_part(session, parts.get_nowait())
+            if progress:
+                await progress(min(uploaded, file_size), file_size, *progress_args)
+    
+    tasks = []
+    try:
+        async with media_sessions(client, math.ceil(workers / WORKERS_PER_SESSION)) as sessions:
+            tasks = [
+                asyncio.create_task(worker(sessions[index % len(sessions)]))
+                for index in range(workers)
+            ]
+            await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    finally:
+        os.close(fd)
+    return input_file(file_id, total_parts, os.path.basename(file_path), is_big)
+
+async def send_uploaded_document(
+    client: Client,
+    chat_id: Union[int, str],
+    file: InputUploadedFile,
+    mime_type: str,
+    attributes: List[Any],
+    caption: Optional[str] = None,
+    reply_to_message_id: Optional[int] = None,
+    thumb: Optional[Any] = None
+) -> Any:
+    """Send an already uploaded file as a document/audio/video message."""
+    text = await pyro_utils.parse_text_entities(client, caption or "", None, None)
+    reply_to = {}
+    if reply_to_message_id:
+        if hasattr(raw.types, "InputReplyToMessage"):
+            reply_to["reply_to"] = raw.types.InputReplyToMessage(
+                reply_to_msg_id=reply_to_message_id
+            )
+        else:
+            reply_to["reply_to_msg_id"] = reply_to_message_id
+
+    return await client.invoke(
+        raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=raw.types.InputMediaUploadedDocument(
+                file=file,
+                mime_type=mime_type or "application/octet-stream",
+                attributes=attributes,
+                thumb=await client.save_file(thumb) if thumb else None
+            ),
+            random_id=client.rnd_id(),
+            **reply_to,
+            **text
+        )
+    )
+
+async def relay_media(
+    source: Client,
+    target: Client,
+    message: Message,
+    chat_id: Union[int, str],
+    file_name: str,
+    caption: Optional[str] = None,
+    reply_to_message_id: Optional[int] = None,
+    thumb: Optional[Any] = None,
+    progress: Optional[Callable] = None,
+    progress_args: tuple = ()
+) -> Any:
+    """
+    Relay a document or audio message without touching the disk:
+    stream_media chunks from `source` are uploaded by `target` as they arrive.
+    """
+    media = message.audio or message.document
+    uploaded = await upload_stream(
+        target,
+        source.stream_media(message),
+        media.file_size,
+        file_name,
+        progress,
+        progress_args
+    )
+
+    attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+    if message.audio:
+        attributes.append(raw.types.DocumentAttributeAudio(
+            duration=message.audio.duration or 0,
+            title=message.audio.title,
+            performer=message.audio.performer
+        ))
+
+    return await call_limited(
+        target, send_uploaded_document,
+        target,
+        chat_id,
+        uploaded,
+        media.mime_type,
+        attributes,
+        caption,
+        reply_to_message_id,
+        thumb
+    )
+
+def sent_message_id(updates: Any) -> Optional[int]:
+    """Extract the ID of the message created by a raw send request."""
+    for update in getattr(updates, "updates", []):
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return update.message.id
+    return None
+
+def record_download(kind: str, size: int, seconds: float) -> None:
+    """Account a finished download under 'sequential' or 'parallel'."""
+    stats = DOWNLOAD_STATS[kind]
+    stats['files'] += 1
+    stats['bytes'] += size
+    stats['seconds'] += seconds
+
+def get_download_stats() -> Dict[str, Any]:
+    """Throughput per download method and the parallel/sequential speedup."""
+    report: Dict[str, Any] = {}
+    for kind, stats in DOWNLOAD_STATS.items():
+        mbps = stats['bytes'] / stats['seconds'] / (1024 * 1024) if stats['seconds'] else 0.0
+        report[kind] = {**stats, 'mb_per_second': mbps}
+    sequential = report['sequential']['mb_per_second']
+    report['speedup'] = report['parallel']['mb_per_second'] / sequential if sequential else None
+    return report
+
+def split_segments(total_chunks: int, workers: int) -> List[Tuple[int, int]]:
+    """Split `total_chunks` into at most `workers` contiguous (first, count) ranges."""
+    workers = max(1, min(workers, total_chunks))
+    size, extra = divmod(total_chunks, workers)
+    segments = []
+    first = 0
+    for index in range(workers):
+        count = size + (1 if index < extra else 0)
+        if count:
+            segments.append((first, count))
+        first += count
+    return segments
+
+async def parallel_download(
+    client: Client,
+    message: Message,
+    file_path: str,
+    file_size: int,
+    workers: int = DOWNLOAD_WORKERS,
+    progress: Optional[Callable] = None,
+    progress_args: tuple = ()
+) -> str:
+    """
+    Download a file as one contiguous range per worker, written at its offset.
+    Each range is a single getFile stream (pyrogram opens a media session,
+    and exports auth to a foreign DC, once per stream), so `workers` streams
+    are in flight instead of one. A stream that fails or ends early is
+    resumed from the last chunk it wrote.
+    """
+    total_chunks = math.ceil(file_size / DOWNLOAD_CHUNK)
+    
+    os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+    fd = os.open(file_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    downloaded = 0
+    started = time.monotonic()
+    
+    async def fetch_segment(first: int, count: int) -> None:
+        nonlocal downloaded
+        done = 0
+        for attempt in range(SEGMENT_RETRIES + 1):
+            try:
+                position = (first + done) * DOWNLOAD_CHUNK
+                async for chunk in client.stream_media(
+                    message, offset=first + done, limit=count - done
+                ):
+                    await asyncio.to_thread(os.pwrite, fd, chunk, position)
+                    position += len(chunk)
+                    done += 1
+                    downloaded += len(chunk)
+                    if progress:
+                        await progress(min(downloaded, file_size), file_size, *progress_args)
+                if done == count:
+                    return
+                raise IOError(f"segment at chunk {first} ended early")
+            except Exception as e:
+                if attempt == SEGMENT_RETRIES:
+                    raise
+                logger.warning(f"Retrying segment at chunk {first + done}: {e}")
+    
+    tasks = []
+    try:
+        os.ftruncate(fd, file_size)  # preallocate
+        tasks = [
+            asyncio.create_task(fetch_segment(first, count))
+            for first, count in split_segments(total_chunks, workers)
+        ]
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        os.close(fd)
+        fd = -1
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+    finally:
+        if fd != -1:
+            os.close(fd)
+    
+    seconds = time.monotonic() - started
+    record_download('parallel', file_size, seconds)
+    speedup = get_download_stats()['speedup']
+    logger.info(
+        f"Parallel download of {file_size / (1024 * 1024):.1f} MB took {seconds:.1f}s"
+        + (f" (average speedup {speedup:.2f}x over sequential)" if speedup else "")
+    )
+    return file_path